@@ -0,0 +1,95 @@
+import random
+
+STATUSES_MOVIE = ["announced", "inCinemas", "released", "deleted"]
+STATUSES_SERIE = ["continuing", "ended", "upcoming"]
+WORDS = [
+    "the", "last", "night", "star", "dark", "city", "house", "river", "king",
+    "lost", "blue", "storm", "empire", "secret", "winter", "garden", "wild",
+]
+
+
+def title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title()
+
+
+def images(itemId):
+    return [
+        {"coverType": "poster", "url": f"/MediaCover/{itemId}/poster.jpg", "remoteUrl": f"https://image.tmdb.org/t/p/original/{itemId}.jpg"},
+        {"coverType": "fanart", "url": f"/MediaCover/{itemId}/fanart.jpg", "remoteUrl": f"https://image.tmdb.org/t/p/original/{itemId}f.jpg"},
+    ]
+
+
+def movie(rng, index):
+    name = title(rng)
+    return {
+        "id": index + 1,
+        "tmdbId": 1000 + index,
+        "title": name,
+        "titleSlug": name.lower().replace(" ", "-") + f"-{1000 + index}",
+        "alternateTitles": [{"title": title(rng)} for _ in range(rng.randint(0, 3))],
+        "year": rng.randint(1950, 2026),
+        "overview": " ".join(rng.choice(WORDS) for _ in range(60)),
+        "monitored": rng.random() < 0.8,
+        "status": rng.choice(STATUSES_MOVIE),
+        "remotePoster": f"https://image.tmdb.org/t/p/original/{1000 + index}.jpg",
+        "images": images(1000 + index),
+        "sizeOnDisk": rng.randint(0, 50 * 1024 ** 3),
+    }
+
+
+def serie(rng, index):
+    name = title(rng)
+    seasonCount = rng.randint(1, 15)
+    return {
+        "id": index + 1,
+        "tvdbId": 70000 + index,
+        "tvRageId": rng.randint(0, 50000),
+        "title": name,
+        "titleSlug": name.lower().replace(" ", "-") + f"-{70000 + index}",
+        "alternateTitles": [{"title": title(rng)} for _ in range(rng.randint(0, 3))],
+        "year": rng.randint(1950, 2026),
+        "overview": " ".join(rng.choice(WORDS) for _ in range(60)),
+        "monitored": rng.random() < 0.8,
+        "status": rng.choice(STATUSES_SERIE),
+        "remotePoster": f"https://artworks.thetvdb.com/banners/{70000 + index}.jpg",
+        "images": images(70000 + index),
+        "statistics": {"seasonCount": seasonCount, "sizeOnDisk": rng.randint(0, 500 * 1024 ** 3)},
+        "seasons": [
+            {"seasonNumber": s, "monitored": True, "statistics": {"episodeCount": 10}}
+            for s in range(seasonCount + 1)
+        ],
+    }
+
+
+def movies(count, seed=1):
+    rng = random.Random(seed)
+    return [movie(rng, i) for i in range(count)]
+
+
+def series(count, seed=1):
+    rng = random.Random(seed)
+    return [serie(rng, i) for i in range(count)]
+
+
+def rootFolders(count=3, unmapped=2000):
+    return [
+        {
+            "id": i + 1,
+            "path": f"/mnt/media/folder{i}",
+            "accessible": True,
+            "freeSpace": 1024 ** 4,
+            "unmappedFolders": [
+                {"name": f"unmapped{j}", "path": f"/mnt/media/folder{i}/unmapped{j}"}
+                for j in range(unmapped)
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def qualityProfiles():
+    return [{"id": i + 1, "name": name, "items": []} for i, name in enumerate(["Any", "HD-1080p", "Ultra-HD"])]
+
+
+def tags(count=50):
+    return [{"id": i + 1, "label": f"tag{i}"} for i in range(count)]
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import yaml
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+SIZES = [1000, 10000, 50000]
+LOOKUPS = 1000  # number of membership/ACL checks per measurement
+SEARCHES = 100  # number of library title searches per measurement
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import fixtures  # noqa: E402
+from stubserver import StubServer  # noqa: E402
+
+
+def getVersion():
+    with open(os.path.join(ROOT_DIR, "src", "addarr.py"), encoding="utf8") as file:
+        return re.search(r'__version__ = "(.*)"', file.read()).group(1)
+
+
+def writeConfig(directory, port):
+    with open(os.path.join(ROOT_DIR, "config_example.yaml"), encoding="utf8") as file:
+        config = yaml.safe_load(file)
+    config["telegram"]["token"] = "123456:benchmark"
+    for app in ["radarr", "sonarr"]:
+        config[app]["server"].update({"addr": "127.0.0.1", "port": port, "path": "/"})
+        config[app]["auth"]["apikey"] = "benchmark"
+    config["logToConsole"] = False
+    config["searchCacheOnDisk"] = False
+    path = os.path.join(directory, "config.yaml")
+    with open(path, "w", encoding="utf8") as file:
+        yaml.safe_dump(config, file)
+    return path
+
+
+def summarize(times, peak):
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "max": max(times),
+        "peakMemory": peak,
+    }
+
+
+def measure(function, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return summarize(times, peak)
+
+
+async def measureAsync(function, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        await function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    await function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return summarize(times, peak)
+
+
+def fakeUpdate(chatId, username):
+    return SimpleNamespace(
+        effective_message=SimpleNamespace(chat_id=chatId),
+        effective_user={"id": chatId, "username": username},
+    )
+
+
+async def benchmarkSize(size, stub, repeat, directory):
+    import acl
+    import commons
+    import radarr
+    import sonarr
+    import state
+
+    movies = fixtures.movies(size)
+    series = fixtures.series(size)
+    stub.routes.update({
+        "/api/v3/movie": json.dumps(movies).encode(),
+        "/api/v3/series": json.dumps(series).encode(),
+    })
+    results = {}
+
+    results["radarr.giveTitles"] = measure(lambda: radarr.giveTitles(movies), repeat)
+    results["sonarr.giveTitles"] = measure(lambda: sonarr.giveTitles(series), repeat)
+
+    titles = radarr.giveTitles(movies)
+
+    def conversationState():
+        conversation = state.Conversation()
+        conversation.setResults(titles)
+        return conversation
+
+    results["state.Conversation.setResults"] = measure(conversationState, repeat)
+    results["state.Conversation.setResults"]["stateSize"] = state.sizeOf(conversationState())
+
+    movieRecords = [radarr.lookupRecord(m) for m in movies]
+    serieRecords = [sonarr.lookupRecord(s) for s in series]
+    results["radarr.buildData"] = measure(
+        lambda: [radarr.default.buildData(r, "/mnt/media", 1, [1]) for r in movieRecords], repeat
+    )
+    results["sonarr.buildData"] = measure(
+        lambda: [sonarr.default.buildData(r, "/mnt/media", 1, [1], r["seasons"]) for r in serieRecords], repeat
+    )
+
+    for name, service in [("radarr", radarr), ("sonarr", sonarr)]:
+        results[f"{name}.library.refresh"] = await measureAsync(service.default.library.refresh, repeat)
+        ids = list(service.default.library.items)[:LOOKUPS]
+
+        async def lookups(service=service, ids=ids):
+            for externalId in ids:
+                await service.inLibrary(externalId)
+
+        results[f"{name}.inLibrary x{LOOKUPS}"] = await measureAsync(lookups, repeat)
+
+    library = radarr.default.library
+    queries = [movie["title"] for movie in movies[:SEARCHES]]
+
+    async def titleIndex():
+        library.titles = None
+        return await library.search(queries[0], 10)
+
+    async def librarySearches():
+        for query in queries:
+            await library.search(query, 10)
+
+    results["radarr.library.search (index)"] = await measureAsync(titleIndex, repeat)
+    results[f"radarr.library.search x{SEARCHES}"] = await measureAsync(librarySearches, repeat)
+
+    async def allMovies():
+        radarr.default.library.snapshot = None
+        return await radarr.all_movies()
+
+    async def allSeries():
+        sonarr.default.library.snapshot = None
+        return await sonarr.allSeries()
+
+    results["radarr.all_movies"] = await measureAsync(allMovies, repeat)
+    results["sonarr.allSeries"] = await measureAsync(allSeries, repeat)
+
+    items = await radarr.all_movies()
+    results["commons.formatListItem"] = measure(
+        lambda: sum(len(commons.formatListItem(i)) for i in items), repeat
+    )
+
+    aclPath = os.path.join(directory, f"acl-{size}.txt")
+    with open(aclPath, "w") as file:
+        for i in range(size):
+            file.write(f"{i} - user{i}\n")
+    acl.chats = acl.AclList("chats", aclPath)
+    acl.admins = acl.AclList("admins", aclPath)
+    updates = [fakeUpdate(i * (size // LOOKUPS or 1), f"user{i}") for i in range(LOOKUPS)]
+    results[f"commons.checkId x{LOOKUPS}"] = measure(
+        lambda: [commons.checkId(u) for u in updates], repeat
+    )
+    results[f"commons.checkAllowed x{LOOKUPS}"] = measure(
+        lambda: [commons.checkAllowed(u, "admin") for u in updates], repeat
+    )
+    return results
+
+
+async def runBenchmarks(sizes, repeat):
+    stub = StubServer({
+        "/api/v3/Rootfolder": fixtures.rootFolders(),
+        "/api/v3/qualityProfile": fixtures.qualityProfiles(),
+        "/api/v3/tag": fixtures.tags(),
+    }).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ["ADDARR_CONFIG"] = writeConfig(directory, stub.port)
+            import httpclient
+
+            results = {}
+            for size in sizes:
+                print(f"Running benchmarks with {size} items...", file=sys.stderr)
+                for name, stats in (await benchmarkSize(size, stub, repeat, directory)).items():
+                    results.setdefault(name, {})[str(size)] = stats
+            await httpclient.closeClients()
+            return results
+    finally:
+        stub.stop()
+
+
+def compare(current, baselinePath):
+    with open(baselinePath, encoding="utf8") as file:
+        baseline = json.load(file)
+    print(f"{'benchmark':40} {'size':>6} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, sizes in current["results"].items():
+        for size, stats in sizes.items():
+            old = baseline["results"].get(name, {}).get(size)
+            if old is None:
+                continue
+            ratio = stats["median"] / old["median"] if old["median"] else float("inf")
+            print(f"{name:40} {size:>6} {old['median']:10.4f} {stats['median']:10.4f} {ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Addarr hot paths against synthetic libraries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    version = getVersion()
+    output = {
+        "version": version,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": asyncio.run(runBenchmarks(args.sizes, args.repeat)),
+    }
+
+    path = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"{version}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf8") as file:
+        json.dump(output, file, indent=2)
+    print(f"Results written to {path}", file=sys.stderr)
+
+    if args.compare:
+        compare(output, args.compare)
+
+
+if __name__ == "__main__":
+    main()
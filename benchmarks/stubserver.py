@@ -0,0 +1,70 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class StubServer:
+    """Minimal local stand-in for the Radarr/Sonarr v3 API, serving fixtures"""
+
+    def __init__(self, routes):
+        # routes: {"/api/v3/movie": payload, ...}, bodies are serialized once
+        self.routes = {path: json.dumps(payload).encode() for path, payload in routes.items()}
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def respond(self, status, body):
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_response(status)
+                    self.send_header("Content-Encoding", "gzip")
+                else:
+                    self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.requests += 1
+                body = stub.routes.get(urlparse(self.path).path.rstrip("/"))
+                if body is None:
+                    self.respond(404, b"[]")
+                else:
+                    self.respond(200, body)
+
+            def do_POST(self):
+                stub.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                payload.setdefault("id", 1)
+                self.respond(201, json.dumps(payload).encode())
+
+            def do_DELETE(self):
+                stub.requests += 1
+                self.respond(200, b"{}")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
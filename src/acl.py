@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import logger
+from config import config
+from definitions import ACL_DB_PATH, ADMIN_PATH, ALLOWLIST_PATH, CHATID_PATH
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.acl", logLevel, config.get("logToConsole", False))
+
+RELOAD_CHECK_INTERVAL = 1  # seconds between checks of the mtime of the backing file
+
+
+def parseLine(line):
+    # Lines look like "<id or username>" or "<id> - <name>"
+    entryId, _, name = line.strip("\n").partition(" - ")
+    return entryId.strip(), (name.strip() or None)
+
+
+def readTextFile(path):
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r") as file:
+        for line in file:
+            entryId, name = parseLine(line)
+            if entryId:
+                entries[entryId] = name
+    return entries
+
+
+def writeTextFile(path, entries):
+    # Write to a temporary file and swap it in, so a crash can't leave half a file
+    directory = os.path.dirname(path)
+    fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=".acl-")
+    try:
+        with os.fdopen(fd, "w") as file:
+            for entryId, name in entries.items():
+                file.write(f"{entryId} - {name}\n" if name else f"{entryId}\n")
+        try:
+            os.replace(tmpPath, path)
+        except OSError:
+            # A file that is bind-mounted (Docker, Helm subPath) can't be replaced
+            with open(tmpPath, "r") as source, open(path, "w") as file:
+                file.write(source.read())
+            os.unlink(tmpPath)
+    except Exception:
+        if os.path.exists(tmpPath):
+            os.unlink(tmpPath)
+        raise
+
+
+class Database:
+    """Optional sqlite backend holding all lists in one table"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS acl ("
+            "list TEXT, id TEXT, name TEXT, PRIMARY KEY (list, id))"
+        )
+        self.db.commit()
+
+    def read(self, listName):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, name FROM acl WHERE list = ?", (listName,)
+            ).fetchall()
+        return {entryId: name for entryId, name in rows}
+
+    def write(self, listName, entries):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO acl VALUES (?, ?, ?)",
+                [(listName, entryId, name) for entryId, name in entries.items()],
+            )
+            self.db.commit()
+
+    def delete(self, listName, entryId):
+        with self.lock:
+            self.db.execute("DELETE FROM acl WHERE list = ? AND id = ?", (listName, entryId))
+            self.db.commit()
+
+
+class AclList:
+    """Entries of one list (chats, admins or allowlist) held in memory.
+
+    The backing file is reloaded when its mtime changes and writes happen
+    off the event loop, so a check is only a set lookup.
+    """
+
+    def __init__(self, name, path, database=None):
+        self.name = name
+        self.path = path
+        self.database = database
+        self.entries = {}
+        self.mtime = None
+        self.lastCheck = 0
+        self.lock = asyncio.Lock()
+        if database is not None and not database.read(name):
+            # First start with the database, import the existing text file
+            database.write(name, readTextFile(path))
+        self.load()
+
+    def backingPath(self):
+        return self.database.path if self.database is not None else self.path
+
+    def getMtime(self):
+        try:
+            return os.stat(self.backingPath()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        self.mtime = self.getMtime()
+        if self.database is not None:
+            self.entries = self.database.read(self.name)
+        else:
+            self.entries = readTextFile(self.path)
+        logger.debug(f"Loaded {len(self.entries)} entries for {self.name}")
+
+    def reloadIfChanged(self):
+        now = time.monotonic()
+        if now - self.lastCheck < RELOAD_CHECK_INTERVAL:
+            return
+        self.lastCheck = now
+        if self.getMtime() != self.mtime:
+            self.load()
+
+    def contains(self, *values):
+        self.reloadIfChanged()
+        return any(str(v) in self.entries for v in values if v is not None)
+
+    def ids(self):
+        self.reloadIfChanged()
+        return list(self.entries)
+
+    async def add(self, entryId, name=None):
+        async with self.lock:
+            if self.database is not None:
+                self.entries[str(entryId)] = name
+                await asyncio.to_thread(self.database.write, self.name, {str(entryId): name})
+            else:
+                await asyncio.to_thread(self.updateTextFile, lambda entries: entries.__setitem__(str(entryId), name))
+            self.mtime = self.getMtime()
+
+    async def remove(self, entryId):
+        async with self.lock:
+            if self.database is not None:
+                self.entries.pop(str(entryId), None)
+                await asyncio.to_thread(self.database.delete, self.name, str(entryId))
+            else:
+                await asyncio.to_thread(self.updateTextFile, lambda entries: entries.pop(str(entryId), None))
+            self.mtime = self.getMtime()
+
+    # Reads the file again right before writing it, so edits made to it since the
+    # last reload aren't overwritten
+    def updateTextFile(self, change):
+        entries = readTextFile(self.path)
+        change(entries)
+        writeTextFile(self.path, entries)
+        self.entries = entries
+
+
+database = Database(ACL_DB_PATH) if config["aclDatabase"] else None
+
+chats = AclList("chats", CHATID_PATH, database)
+admins = AclList("admins", ADMIN_PATH, database)
+allowlist = AclList("allowlist", ALLOWLIST_PATH, database)
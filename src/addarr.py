@@ -2,22 +2,36 @@
 
 import logging
 import re
+import sqlite3
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-import telegram
-from telegram.constants import ParseMode
 from telegram.ext import (CallbackQueryHandler, CommandHandler,
-                          ConversationHandler, filters, MessageHandler,
-                          Application)
+                          ConversationHandler, filters, InlineQueryHandler,
+                          MessageHandler, Application, ExtBot)
 from telegram.warnings import PTBUserWarning
 
 from commons import checkAllowed, checkId, authentication, format_bytes, getAuthChats
+import breaker
+import carousel
+import httpclient
+import instances
 import logger
+import metrics
+from persistence import SqlitePersistence
+import prefetch
+import sendqueue
 import radarr as radarr
+import state
 import sonarr as sonarr
+import unified
+from searchcache import cache as searchCache
 import delete as delete
+import inline
 import all as all
+import batch
+import watchlist
 from config import checkConfigValues, config, checkConfig
+from definitions import PERSISTENCE_PATH
 from translations import i18n
 from warnings import filterwarnings
 
@@ -30,29 +44,132 @@ logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr", logLevel, config.get("logToConsole", False))
 logger.debug(f"Addarr v{__version__} starting up...")
 
-SERIE_MOVIE_AUTHENTICATED, READ_CHOICE, GIVE_OPTION, GIVE_PATHS, TSL_NORMAL, GIVE_QUALITY_PROFILES, SELECT_SEASONS = range(7)
+SERIE_MOVIE_AUTHENTICATED, READ_CHOICE, GIVE_OPTION, GIVE_PATHS, TSL_NORMAL, GIVE_QUALITY_PROFILES, SELECT_SEASONS, GIVE_INSTANCE = range(8)
 SERIE_MOVIE_DELETE, READ_DELETE_CHOICE = 0,1
 
-application = Application.builder().token(config["telegram"]["token"]).build()
+
+# Long running jobs, cancelled on shutdown
+backgroundTasks = []
+
+
+async def postInit(application):
+    for instance in radarr.instances + sonarr.instances:
+        try:
+            # Resolves the default tags once
+            await instance.tagCache.refresh()
+        except Exception as e:
+            logger.warning(f"Loading the tags of {instance.name} failed: {e}")
+        for cache in [instance.library, instance.rootFolders, instance.qualityProfiles]:
+            backgroundTasks.append(asyncio.create_task(cache.refreshPeriodically()))
+    if config["metrics"]["enable"]:
+        await metrics.startServer()
+
+
+async def postShutdown(application):
+    for task in backgroundTasks:
+        task.cancel()
+    watchlist.cancelAll()
+    await metrics.stopServer()
+    await httpclient.closeClients()
+
+
+builder = (
+    Application.builder()
+    .token(config["telegram"]["token"])
+    .post_init(postInit)
+    .post_shutdown(postShutdown)
+    .rate_limiter(sendqueue.limiter)
+)
+if config["telegram"].get("apiUrl"):
+    builder = builder.base_url(config["telegram"]["apiUrl"])
+if config["metrics"]["enable"]:
+    builder = builder.request(metrics.InstrumentedRequest())
+if config["persistence"]:
+    try:
+        builder = builder.persistence(SqlitePersistence(PERSISTENCE_PATH, config["persistenceInterval"]))
+    except sqlite3.Error as e:
+        logger.warning(f"Conversations won't survive a restart, opening {PERSISTENCE_PATH} failed: {e}")
+        config["persistence"] = False
+application = builder.build()
+
+
+def registerGauges(conversationHandlers):
+    metrics.Gauge(
+        "addarr_active_conversations",
+        "Conversations that haven't ended yet",
+        lambda: {
+            (("conversation", name),): len(getattr(handler, "_conversations", {}))
+            for name, handler in conversationHandlers.items()
+        },
+    )
+
+    def cacheSizes():
+        sizes = {(("cache", "search"), ("backend", "all")): len(searchCache.entries)}
+        for instance in radarr.instances + sonarr.instances:
+            name = instance.app
+            sizes[(("cache", "library"), ("backend", name))] = len(instance.library.items)
+            sizes[(("cache", "tags"), ("backend", name))] = len(instance.tagCache.labels or {})
+            sizes[(("cache", "rootFolders"), ("backend", name))] = len(instance.rootFolders.data or [])
+            sizes[(("cache", "qualityProfiles"), ("backend", name))] = len(instance.qualityProfiles.data or [])
+        return sizes
+
+    metrics.Gauge("addarr_cache_items", "Items held in the in-memory caches", cacheSizes)
+    metrics.Gauge(
+        "addarr_conversation_state_bytes",
+        "Memory held by the state of the unfinished conversations",
+        lambda: sum(state.sizeOf(data["state"]) for data in application.user_data.values() if "state" in data),
+    )
+    metrics.Gauge(
+        "addarr_circuit_breaker_state",
+        "State of the circuit breaker of each backend: 0 closed, 1 half-open, 2 open",
+        lambda: {(("backend", app),): circuit.state for app, circuit in breaker.breakers.items()},
+    )
+    metrics.Gauge(
+        "addarr_send_queue_depth",
+        "Requests to Telegram waiting for the rate limits",
+        lambda: {(("priority", name),): count for name, count in sendqueue.limiter.depth().items()},
+    )
 
 async def startCheck():
-    bot = telegram.Bot(token=config["telegram"]["token"])
+    # Its own rate limiter, the one of the application belongs to the loop of main()
+    bot = ExtBot(
+        token=config["telegram"]["token"],
+        base_url=config["telegram"].get("apiUrl") or "https://api.telegram.org/bot",
+        rate_limiter=sendqueue.SendQueue(),
+    )
     missingConfig = checkConfig()
     wrongValues = checkConfigValues()
     check=True
     if missingConfig: #empty list is False
         check = False
         logger.error(i18n.t("addarr.Missing config", missingKeys=f"{missingConfig}"[1:-1]))
-        for chat in getAuthChats():
-            await bot.send_message(chat_id=chat, text=i18n.t("addarr.Missing config", missingKeys=f"{missingConfig}"[1:-1]))
+        await broadcast(bot, i18n.t("addarr.Missing config", missingKeys=f"{missingConfig}"[1:-1]))
     if wrongValues:
         check=False
         logger.error(i18n.t("addarr.Wrong values", wrongValues=f"{wrongValues}"[1:-1]))
-        for chat in getAuthChats():
-            await bot.send_message(chat_id=chat, text=i18n.t("addarr.Wrong values", wrongValues=f"{wrongValues}"[1:-1]))
+        await broadcast(bot, i18n.t("addarr.Wrong values", wrongValues=f"{wrongValues}"[1:-1]))
     return check
 
 
+# A backend that is down ends up here from any handler. The user gets a reply right
+# away and the conversation stays where it was, so the step can be tried again.
+async def errorHandler(update, context):
+    if isinstance(context.error, breaker.BackendUnavailable) and isinstance(update, Update) and update.effective_chat:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=i18n.t("addarr.Unavailable", service=instances.nameOf(context.error.app)),
+        )
+        return
+    logger.error(f"Handling an update failed: {context.error}", exc_info=context.error)
+
+
+async def broadcast(bot, text):
+    await asyncio.gather(*(
+        bot.send_message(chat_id=chat, text=text, rate_limit_args=sendqueue.BROADCAST_ARGS)
+        for chat in getAuthChats()
+    ))
+
+
 def main():
     filterwarnings(action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning)
 
@@ -80,6 +197,8 @@ def main():
     )
 
     deleteMovieserie_handler = ConversationHandler(
+        name="delete",
+        persistent=config["persistence"],
         entry_points=[
             CommandHandler(config["entrypointDelete"], delete.delete),
             MessageHandler(
@@ -90,7 +209,7 @@ def main():
             ),
         ],
         states={
-            SERIE_MOVIE_DELETE: [MessageHandler(filters.TEXT, choiceSerieMovie)],
+            SERIE_MOVIE_DELETE: [MessageHandler(filters.TEXT, delete.choiceDeleteSerieMovie)],
             READ_DELETE_CHOICE: [
                 MessageHandler(
                     filters.Regex(f'^({i18n.t("addarr.Movie")}|{i18n.t("addarr.Series")})$'),
@@ -104,11 +223,15 @@ def main():
                     filters.Regex(f'^({i18n.t("addarr.Delete")})$'),
                     delete.deleteSerieMovie
                 ),
+                CallbackQueryHandler(delete.nextMatch, pattern=f'({i18n.t("addarr.Next result")})'),
                 MessageHandler(
                     filters.Regex(f'^({i18n.t("addarr.New")})$'),
-                    delete
+                    delete.delete
                 ),
-                CallbackQueryHandler(delete, pattern=f'({i18n.t("addarr.New")})'),
+                CallbackQueryHandler(delete.delete, pattern=f'({i18n.t("addarr.New")})'),
+            ],
+            delete.DELETE_INSTANCE: [
+                CallbackQueryHandler(delete.selectDeleteInstance, pattern="^(Instance: )(.*)$"),
             ],
         },
         fallbacks=[
@@ -119,7 +242,10 @@ def main():
     )
 
     addMovieserie_handler = ConversationHandler(
+        name="add",
+        persistent=config["persistence"],
         entry_points=[
+            MessageHandler(filters.Regex(inline.RESULT_PATTERN), inline.startFromResult),
             CommandHandler(config["entrypointAdd"], startSerieMovie),
             CommandHandler(i18n.t("addarr.Movie"), startSerieMovie),
             CommandHandler(i18n.t("addarr.Series"), startSerieMovie),
@@ -150,10 +276,10 @@ def main():
                     filters.Regex(f'^({i18n.t("addarr.Select")})$'),
                     qualityProfileSerieMovie
                 ),
-                CallbackQueryHandler(pathSerieMovie, pattern=f'({i18n.t("addarr.Add")})'),
+                CallbackQueryHandler(instanceSerieMovie, pattern=f'({i18n.t("addarr.Add")})'),
                 MessageHandler(
                     filters.Regex(f'^({i18n.t("addarr.Add")})$'),
-                    pathSerieMovie
+                    instanceSerieMovie
                 ),
                 CallbackQueryHandler(nextOption, pattern=f'({i18n.t("addarr.Next result")})'),
                 MessageHandler(
@@ -166,6 +292,9 @@ def main():
                 ),
                 CallbackQueryHandler(startSerieMovie, pattern=f'({i18n.t("addarr.New")})'),
             ],
+            GIVE_INSTANCE: [
+                CallbackQueryHandler(selectInstance, pattern="^(Instance: )(.*)$"),
+            ],
             GIVE_PATHS: [
                 CallbackQueryHandler(qualityProfileSerieMovie, pattern="^(Path: )(.*)$"),
             ],
@@ -182,6 +311,45 @@ def main():
             CallbackQueryHandler(stop, pattern=f"(?i)^"+i18n.t("addarr.Stop")+"$"),
         ],
     )
+    batch_handler = ConversationHandler(
+        name="batch",
+        persistent=config["persistence"],
+        entry_points=[
+            CommandHandler(config["entrypointBatch"], batch.batch),
+            MessageHandler(
+                filters.Regex(
+                    re.compile(r'^' + config["entrypointBatch"] + '$', re.IGNORECASE)
+                ),
+                batch.batch,
+            ),
+        ],
+        states={
+            batch.BATCH_TITLES: [MessageHandler(filters.TEXT & ~filters.COMMAND, batch.readTitles)],
+            batch.BATCH_CHOICE: [
+                CallbackQueryHandler(batch.resolveTitles, pattern=f'^({i18n.t("addarr.Movie")}|{i18n.t("addarr.Series")})$'),
+            ],
+            batch.BATCH_CONFIRM: [
+                CallbackQueryHandler(batch.choosePath, pattern="^Batch: add$"),
+                CallbackQueryHandler(batch.toggleItem, pattern="^Batch: [0-9]+$"),
+            ],
+            batch.BATCH_PATH: [
+                CallbackQueryHandler(batch.selectPath, pattern="^(Path: )(.*)$"),
+            ],
+            batch.BATCH_QUALITY: [
+                CallbackQueryHandler(batch.selectQuality, pattern="^(Quality profile: )(.*)$"),
+            ],
+        },
+        fallbacks=[
+            CommandHandler("stop", stop),
+            MessageHandler(filters.Regex("(?i)^"+i18n.t("addarr.Stop")+"$"), stop),
+            CallbackQueryHandler(stop, pattern="(?i)^"+i18n.t("addarr.Stop")+"$"),
+        ],
+    )
+    allPages_handler = CallbackQueryHandler(
+        all.changePage, pattern=f"^({all.ALL_SERIES}|{all.ALL_MOVIES}): [0-9]+$"
+    )
+    application.add_handler(allPages_handler)
+
     if config["transmission"]["enable"]:
         import transmission as transmission
         changeTransmissionSpeed_handler = ConversationHandler(
@@ -242,13 +410,48 @@ def main():
     application.add_handler(allMovies_handler_text)
     application.add_handler(addMovieserie_handler)
     application.add_handler(deleteMovieserie_handler)
+    application.add_handler(batch_handler)
+    application.add_handler(
+        MessageHandler(
+            filters.Document.FileExtension("csv") | filters.Document.FileExtension("json"),
+            watchlist.importFile,
+        )
+    )
+    # Not blocking, so a newer query can cancel the lookup of an older one
+    application.add_handler(InlineQueryHandler(inline.inlineQuery, block=False))
 
     help_handler_command = CommandHandler(config["entrypointHelp"], help)
     application.add_handler(help_handler_command)
+    application.add_error_handler(errorHandler)
+
+    if config["metrics"]["enable"]:
+        registerGauges({"add": addMovieserie_handler, "delete": deleteMovieserie_handler, "batch": batch_handler})
 
     logger.info(i18n.t("addarr.Start chatting"))
-    application.run_polling()
+    if config["webhook"]["enable"]:
+        runWebhook()
+    else:
+        application.run_polling()
+
+
+# Let Telegram post the updates to us instead of long polling. The webhook stays
+# set on shutdown, so Telegram keeps the updates until the bot is back.
+def runWebhook():
+    webhook = config["webhook"]
+    listen = webhook.get("listen", "0.0.0.0")
+    port = webhook.get("port", 8443)
+    path = webhook.get("path", "/telegram")
+    logger.info(f"Receiving updates on http://{listen}:{port}{path}")
+    application.run_webhook(
+        listen=listen,
+        port=port,
+        url_path=path.strip("/"),
+        webhook_url=webhook.get("url") or None,
+        secret_token=webhook.get("secretToken") or None,
+        allowed_updates=Update.ALL_TYPES,
+    )
 
+@metrics.timed
 async def stop(update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
@@ -263,9 +466,7 @@ async def stop(update, context):
         
     if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
         adminNotifyId = config.get("adminNotifyId")
-        await context.bot.send_message(
-            chat_id=adminNotifyId, text=i18n.t("addarr.Notifications.Stop", first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-        )
+        sendqueue.notify(context.bot, adminNotifyId, i18n.t("addarr.Notifications.Stop", first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id))
     clearUserData(context)
     await context.bot.send_message(
         chat_id=update.effective_message.chat_id, text=i18n.t("addarr.End")
@@ -273,6 +474,7 @@ async def stop(update, context):
     return ConversationHandler.END
     
 
+@metrics.timed
 async def startSerieMovie(update : Update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
@@ -297,17 +499,15 @@ async def startSerieMovie(update : Update, context):
         i18n.t("addarr.Movie").lower(),
     ]:
         logger.debug(
-            f"User issued {reply} command, so setting user_data[choice] accordingly"
+            f"User issued {reply} command, so setting the choice accordingly"
         )
-        context.user_data.update(
-            {
-                "choice": i18n.t("addarr.Series")
-                if reply[1:] == i18n.t("addarr.Series").lower()
-                else i18n.t("addarr.Movie")
-            }
+        state.get(context).choice = (
+            i18n.t("addarr.Series")
+            if reply[1:] == i18n.t("addarr.Series").lower()
+            else i18n.t("addarr.Movie")
         )
     elif reply == i18n.t("addarr.New").lower():
-        logger.debug("User issued New command, so clearing user_data")
+        logger.debug("User issued New command, so clearing the conversation state")
         clearUserData(context)
     
     await context.bot.send_message(
@@ -315,13 +515,12 @@ async def startSerieMovie(update : Update, context):
     )
     if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
         adminNotifyId = config.get("adminNotifyId")
-        await context.bot.send_message(
-            chat_id=adminNotifyId, text=i18n.t("addarr.Notifications.Start", first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-        )
+        sendqueue.notify(context.bot, adminNotifyId, i18n.t("addarr.Notifications.Start", first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id))
     
     return SERIE_MOVIE_AUTHENTICATED
 
 
+@metrics.timed
 async def choiceSerieMovie(update, context):
     if not checkId(update):
         if (
@@ -346,16 +545,20 @@ async def choiceSerieMovie(update, context):
             logger.debug(
                 f"User entered a title {reply}"
             )
-            context.user_data["title"] = reply
+            state.get(context).title = reply
 
-        if context.user_data.get("choice") in [
+        if state.get(context).choice in [
             i18n.t("addarr.Series"),
             i18n.t("addarr.Movie"),
         ]:
             logger.debug(
-                f"user_data[choice] is {context.user_data['choice']}, skipping step of selecting movie/series"
+                f"Choice is {state.get(context).choice}, skipping step of selecting movie/series"
             )
             return await searchSerieMovie(update, context)
+        elif config["unifiedSearch"]:
+            logger.debug("Searching movies and series together, skipping step of selecting movie/series")
+            state.get(context).unified = True
+            return await searchSerieMovie(update, context)
         else:
             keyboard = [
                 [
@@ -376,28 +579,25 @@ async def choiceSerieMovie(update, context):
             ]
             markup = InlineKeyboardMarkup(keyboard)
             msg = await update.message.reply_text(i18n.t("addarr.What is this?"), reply_markup=markup)
-            context.user_data["update_msg"] = msg.message_id
+            state.get(context).messageId = msg.message_id
         return READ_CHOICE
 
 
+@metrics.timed
 async def searchSerieMovie(update, context):
-    title = context.user_data["title"]
+    conversation = state.get(context)
 
-    if not context.user_data.get("choice"):
+    if not conversation.choice and not conversation.unified:
         choice = None
         if update.message is not None:
             choice = update.message.text
         elif update.callback_query is not None:
             choice = update.callback_query.data
-        context.user_data["choice"] = choice
-    
-    choice = context.user_data["choice"]
-    
-    position = context.user_data["position"] = 0
+        conversation.choice = choice
 
-    service = getService(context)
+    service = getSearchService(context)
 
-    searchResult = service.search(title)
+    searchResult = await service.search(conversation.title)
     if not searchResult:
         await context.bot.send_message( 
             chat_id=update.effective_message.chat_id, 
@@ -406,190 +606,134 @@ async def searchSerieMovie(update, context):
         clearUserData(context)
         return ConversationHandler.END
 
-    context.user_data["output"] = service.giveTitles(searchResult)
-    message=i18n.t("addarr.searchresults", count=len(searchResult))
-    message += f"\n\n*{context.user_data['output'][position]['title']} ({context.user_data['output'][position]['year']})*"
-    
-    if "update_msg" in context.user_data:
-        await context.bot.edit_message_text(
-            message_id=context.user_data["update_msg"],
-            chat_id=update.effective_message.chat_id,
-            text=message,
-            parse_mode=ParseMode.MARKDOWN,
-        )
-    else:
-        msg = await context.bot.send_message(chat_id=update.effective_message.chat_id, text=message,parse_mode=ParseMode.MARKDOWN,)
-        context.user_data["update_msg"] = msg.message_id
-    
-    try:
-        img = await context.bot.sendPhoto(
+    conversation.setResults(service.giveTitles(searchResult))
+    return await showResult(update, context)
+
+
+@metrics.timed
+async def nextOption(update, context):
+    state.get(context).position += 1
+    return await showResult(update, context)
+
+
+# Show the current result in the result message, in place
+async def showResult(update, context):
+    conversation = state.get(context)
+    searchService = getSearchService(context)
+    result = await conversation.result(searchService)
+    if result is None:
+        await context.bot.send_message(
             chat_id=update.effective_message.chat_id,
-            photo=context.user_data["output"][position]["poster"],
+            text=i18n.t("addarr.searchresults", count=0),
         )
-    except:
-        context.user_data["photo_update_msg"] = None
-    else:
-        context.user_data["photo_update_msg"] = img.message_id
-    
-    if len(searchResult) == 1:
-        keyboard = [
-            [
-                InlineKeyboardButton(
-                    '\U00002795 '+i18n.t("addarr.Add"),
-                    callback_data=i18n.t("addarr.Add")
-                ),
-            ],[
-                InlineKeyboardButton(
-                    '\U0001F5D1 '+i18n.t("addarr.New"),
-                    callback_data=i18n.t("addarr.New")
-                ),
-            ],[
-                InlineKeyboardButton(
-                    '\U0001F6D1 '+i18n.t("addarr.Stop"),
-                    callback_data=i18n.t("addarr.Stop")
-                ),
-            ],
+        clearUserData(context)
+        return ConversationHandler.END
+    if result.kind is not None:
+        # The texts of the next steps depend on the kind of the result
+        conversation.choice = i18n.t("addarr.Movie") if result.kind == unified.MOVIE else i18n.t("addarr.Series")
+    service = getService(context)
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                '\U00002795 '+i18n.t("addarr.Add"),
+                callback_data=i18n.t("addarr.Add")
+            ),
         ]
-    else: 
-        keyboard = [
+    ]
+    if conversation.hasNext():
+        keyboard += [
             [
-                InlineKeyboardButton(
-                    '\U00002795 '+i18n.t("addarr.Add"),
-                    callback_data=i18n.t("addarr.Add")
-                ),
-            ],[
                 InlineKeyboardButton(
                     '\U000023ED '+i18n.t("addarr.Next result"),
                     callback_data=i18n.t("addarr.Next result")
                 ),
-            ],[
-                InlineKeyboardButton(
-                    '\U0001F5D1 '+i18n.t("addarr.New"),
-                    callback_data=i18n.t("addarr.New")
-                ),
-            ],[
-                InlineKeyboardButton(
-                    '\U0001F6D1 '+i18n.t("addarr.Stop"),
-                    callback_data=i18n.t("addarr.Stop")
-                ),
-            ],
+            ]
         ]
+    keyboard += [
+        [
+            InlineKeyboardButton(
+                '\U0001F5D1 '+i18n.t("addarr.New"),
+                callback_data=i18n.t("addarr.New")
+            ),
+        ],[
+            InlineKeyboardButton(
+                '\U0001F6D1 '+i18n.t("addarr.Stop"),
+                callback_data=i18n.t("addarr.Stop")
+            ),
+        ],
+    ]
     markup = InlineKeyboardMarkup(keyboard)
 
-    if choice == i18n.t("addarr.Movie"):
-        message=i18n.t("addarr.messages.This", subjectWithArticle=i18n.t("addarr.MovieWithArticle").lower())
+    message=i18n.t("addarr.searchresults", count=len(conversation.ids))
+    mark = unified.marks[result.kind] + " " if result.kind is not None else ""
+    message += f"\n\n{mark}*{result.title} ({result.year})*\n\n"
+    if conversation.choice == i18n.t("addarr.Movie"):
+        message+=i18n.t("addarr.messages.This", subjectWithArticle=i18n.t("addarr.MovieWithArticle").lower())
     else:
-        message=i18n.t("addarr.messages.This", subjectWithArticle=i18n.t("addarr.SeriesWithArticle").lower())
-    msg = await context.bot.send_message(
-        chat_id=update.effective_message.chat_id, text=message, reply_markup=markup
-    )
-    context.user_data["title_update_msg"] = context.user_data["update_msg"]
-    context.user_data["update_msg"] = msg.message_id
-    
+        message+=i18n.t("addarr.messages.This", subjectWithArticle=i18n.t("addarr.SeriesWithArticle").lower())
+    if len(service.instances) > 1:
+        message += "\n\n" + instances.libraryBadges(service.instances, await service.libraryInstances(result.id))
+
+    await carousel.showResult(context, update.effective_message.chat_id, message, markup, result.poster)
+    prefetch.schedule(context, searchService, conversation)
     return GIVE_OPTION
 
 
-async def nextOption(update, context):
-    position = context.user_data["position"] + 1
-    context.user_data["position"] = position
-    searchResult = context.user_data["output"]
-    choice = context.user_data["choice"]    
-    message=i18n.t("addarr.searchresults", count=len(searchResult))
-    message += f"\n\n*{context.user_data['output'][position]['title']} ({context.user_data['output'][position]['year']})*"
-    await context.bot.edit_message_text(
-        message_id=context.user_data["title_update_msg"],
-        chat_id=update.effective_message.chat_id,
-        text=message,
-        parse_mode=ParseMode.MARKDOWN,
-    )
-    
-    if position < len(context.user_data["output"]) - 1:
-        keyboard = [
-                [
-                    InlineKeyboardButton(
-                        '\U00002795 '+i18n.t("addarr.Add"),
-                        callback_data=i18n.t("addarr.Add")
-                    ),
-                ],[
-                    InlineKeyboardButton(
-                        '\U000023ED '+i18n.t("addarr.Next result"),
-                        callback_data=i18n.t("addarr.Next result")
-                    ),
-                ],[
-                    InlineKeyboardButton(
-                        '\U0001F5D1 '+i18n.t("addarr.New"),
-                        callback_data=i18n.t("addarr.New")
-                    ),
-                ],[
-                    InlineKeyboardButton(
-                        '\U0001F6D1 '+i18n.t("addarr.Stop"),
-                        callback_data=i18n.t("addarr.Stop")
-                    ),
-                ],
-            ]
-    else:
-        keyboard = [
-            [
-                InlineKeyboardButton(
-                    '\U00002795 '+i18n.t("addarr.Add"),
-                    callback_data=i18n.t("addarr.Add")
-                ),
-            ],[
-                InlineKeyboardButton(
-                    '\U0001F5D1 '+i18n.t("addarr.New"),
-                    callback_data=i18n.t("addarr.New")
-                ),
-            ],[
-                InlineKeyboardButton(
-                    '\U0001F6D1 '+i18n.t("addarr.Stop"),
-                    callback_data=i18n.t("addarr.Stop")
-                ),
-            ],
-        ]
+# With several instances, ask which one to add to. Instances that already have
+# the result aren't offered.
+@metrics.timed
+async def instanceSerieMovie(update, context):
+    conversation = state.get(context)
+    service = getService(context)
+    if len(service.instances) == 1:
+        conversation.instance = service.default.app
+        return await pathSerieMovie(update, context)
+
+    result = await conversation.result(getSearchService(context))
+    having = await service.libraryInstances(result.id)
+    candidates = [i for i in service.instances if i not in having]
+    if not candidates:
+        return await alreadyInLibrary(update, context, result)
+    if len(candidates) == 1:
+        logger.debug(f"Only {candidates[0].name} doesn't have it yet, so adding it there...")
+        conversation.instance = candidates[0].app
+        return await pathSerieMovie(update, context)
+
+    keyboard = [
+        [InlineKeyboardButton(i.name, callback_data=f"Instance: {i.app}")]
+        for i in candidates
+    ]
     markup = InlineKeyboardMarkup(keyboard)
-
-    if context.user_data["photo_update_msg"]:
-        await context.bot.delete_message(
-            message_id=context.user_data["photo_update_msg"],
-            chat_id=update.effective_message.chat_id,
-        )
-    
-    try:
-        img = await context.bot.sendPhoto(
-            chat_id=update.effective_message.chat_id,
-            photo=context.user_data["output"][position]["poster"],
-        )
-    except:
-        context.user_data["photo_update_msg"] = None
-    else:
-        context.user_data["photo_update_msg"] = img.message_id
-    
-    await context.bot.delete_message(
-        message_id=context.user_data["update_msg"],
-        chat_id=update.effective_message.chat_id,
-    )
-    if choice == i18n.t("addarr.Movie"):
-        message=i18n.t("addarr.messages.This", subjectWithArticle=i18n.t("addarr.MovieWithArticle").lower())
-    else:
-        message=i18n.t("addarr.messages.This", subjectWithArticle=i18n.t("addarr.SeriesWithArticle").lower())
-    msg = await context.bot.send_message(
-        chat_id=update.effective_message.chat_id, text=message, reply_markup=markup
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, i18n.t("addarr.Select an instance"), markup
     )
-    context.user_data["update_msg"] = msg.message_id
-    return GIVE_OPTION
-    
+    return GIVE_INSTANCE
+
+
+@metrics.timed
+async def selectInstance(update, context):
+    app = update.callback_query.data.replace("Instance: ", "").strip()
+    if app not in [i.app for i in getService(context).instances]:
+        logger.debug(f"Callback query [{app}] doesn't match any of the instances. Sending instances for selection...")
+        return await instanceSerieMovie(update, context)
+    state.get(context).instance = app
+    return await pathSerieMovie(update, context)
+
 
+@metrics.timed
 async def pathSerieMovie(update, context):
-    service = getService(context)
-    paths = service.getRootFolders()
+    service = getInstance(context)
+    paths = await service.getRootFolders()
     excluded_root_folders = service.config.get("excludedRootFolders", [])
     paths = [p for p in paths if p["path"] not in excluded_root_folders]
     logger.debug(f"Excluded root folders: {excluded_root_folders}")
-    context.user_data.update({"paths": [p["path"] for p in paths]})
+    conversation = state.get(context)
+    conversation.paths = [p["path"] for p in paths]
     if len(paths) == 1:
         # There is only 1 path, so use it!
         logger.debug("Only found 1 path, so proceeding with that one...")
-        context.user_data["path"] = paths[0]["path"]
+        conversation.path = paths[0]["path"]
         return await qualityProfileSerieMovie(update, context)
         
     keyboard = []
@@ -607,23 +751,22 @@ async def pathSerieMovie(update, context):
         ]]
     markup = InlineKeyboardMarkup(keyboard)
 
-    await context.bot.edit_message_text(
-        message_id=context.user_data["update_msg"],
-        chat_id=update.effective_message.chat_id,
-        text=i18n.t("addarr.Select a path"),
-        reply_markup=markup,
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, i18n.t("addarr.Select a path"), markup
     )
     return GIVE_PATHS
 
 
+@metrics.timed
 async def qualityProfileSerieMovie(update, context):
-    if not context.user_data.get("path"):
+    conversation = state.get(context)
+    if not conversation.path:
         # Path selection should be in the update message
         path = None
         if update.callback_query is not None:
             try_path = update.callback_query.data.replace("Path: ", "").strip()
-            if try_path in context.user_data.get("paths", {}):
-                context.user_data["path"] = try_path
+            if try_path in (conversation.paths or []):
+                conversation.path = try_path
                 path = try_path
         if path is None:
             logger.debug(
@@ -631,17 +774,17 @@ async def qualityProfileSerieMovie(update, context):
             )
             return await pathSerieMovie(update, context)
 
-    service = getService(context)
+    service = getInstance(context)
 
     excluded_quality_profiles = service.config.get("excludedQualityProfiles", [])
-    qualityProfiles = service.getQualityProfiles()
+    qualityProfiles = await service.getQualityProfiles()
     qualityProfiles = [q for q in qualityProfiles if q["name"] not in excluded_quality_profiles]
     
-    context.user_data.update({"qualityProfiles": [q['id'] for q in qualityProfiles]})
+    conversation.qualityProfiles = [q['id'] for q in qualityProfiles]
     if len(qualityProfiles) == 1:
         # There is only 1 path, so use it!
         logger.debug("Only found 1 profile, so proceeding with that one...")
-        context.user_data["qualityProfile"] = qualityProfiles[0]['id']
+        conversation.qualityProfile = qualityProfiles[0]['id']
         return await selectSeasons(update, context)
 
     keyboard = []
@@ -654,39 +797,37 @@ async def qualityProfileSerieMovie(update, context):
         ]]
     markup = InlineKeyboardMarkup(keyboard)
 
-    await context.bot.edit_message_text(
-        message_id=context.user_data["update_msg"],
-        chat_id=update.effective_message.chat_id,
-        text=i18n.t("addarr.Select a quality"),
-        reply_markup=markup,
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, i18n.t("addarr.Select a quality"), markup
     )
     return GIVE_QUALITY_PROFILES
 
 
+@metrics.timed
 async def selectSeasons(update, context):
-    if not context.user_data.get("qualityProfile"):
+    conversation = state.get(context)
+    if not conversation.qualityProfile:
         # Quality selection should be in the update message
         qualityProfile = None
         if update.callback_query is not None:
             try_qualityProfile = update.callback_query.data.replace("Quality profile: ", "").strip()
-            if int(try_qualityProfile) in context.user_data.get("qualityProfiles", {}):
-                context.user_data["qualityProfile"] = try_qualityProfile
+            if int(try_qualityProfile) in (conversation.qualityProfiles or []):
+                conversation.qualityProfile = int(try_qualityProfile)
                 qualityProfile = int(try_qualityProfile)
         if qualityProfile is None:
             logger.debug(
                 f"Callback query [{update.callback_query.data.replace('Quality profile: ', '').strip()}] doesn't match any of the quality profiles. Sending quality profiles for selection..."
             )
-            return qualityProfileSerieMovie(update, context)
+            return await qualityProfileSerieMovie(update, context)
 
     service = getService(context)
     if service == radarr:
         return await addSerieMovie(update, context)
     
-    position = context.user_data["position"]
-    idnumber = context.user_data["output"][position]["id"]
-    seasons = service.getSeasons(idnumber)
+    result = await conversation.result(getSearchService(context))
+    seasons = await getInstance(context).getSeasons(result.id, result.lookup)
     seasonNumbers = [s["seasonNumber"] for s in seasons]
-    context.user_data["seasons"] = seasonNumbers
+    conversation.seasons = seasonNumbers
     selectedSeasons = []
 
     keyboard = [[InlineKeyboardButton('\U0001F5D3 ' + i18n.t("addarr.Selected and future seasons"),callback_data="Season: Future and selected")]]
@@ -703,22 +844,21 @@ async def selectSeasons(update, context):
 
     markup = InlineKeyboardMarkup(keyboard)
 
-    context.user_data["selectedSeasons"] = selectedSeasons
+    conversation.selectedSeasons = selectedSeasons
 
-    await context.bot.edit_message_text(
-        message_id=context.user_data["update_msg"],
-        chat_id=update.effective_message.chat_id,
-        text=i18n.t("addarr.Select from which season"),
-        reply_markup=markup,
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, i18n.t("addarr.Select from which season"), markup
     )
     return SELECT_SEASONS
 
+@metrics.timed
 async def checkSeasons(update, context):
-    choice = context.user_data["choice"]
-    seasons = context.user_data["seasons"]
+    conversation = state.get(context)
+    choice = conversation.choice
+    seasons = conversation.seasons
     selectedSeasons = []
-    if "selectedSeasons" in context.user_data:
-        selectedSeasons = context.user_data["selectedSeasons"]
+    if conversation.selectedSeasons is not None:
+        selectedSeasons = conversation.selectedSeasons
     
     if choice == i18n.t("addarr.Series"):
         if update.callback_query is not None:
@@ -737,7 +877,7 @@ async def checkSeasons(update, context):
                     )
                 logger.debug(f"Seasons {seasonsSelected} have been selected.")
                 
-                context.user_data["selectedSeasons"] = selectedSeasons
+                conversation.selectedSeasons = selectedSeasons
                 return await addSerieMovie(update, context)
               
             else:
@@ -754,7 +894,7 @@ async def checkSeasons(update, context):
                 else:
                     selectedSeasons.remove(int(insertSeason))
                     
-                context.user_data["selectedSeasons"] = selectedSeasons
+                conversation.selectedSeasons = selectedSeasons
                 keyboard = [[InlineKeyboardButton('\U0001F5D3 ' + i18n.t("addarr.Selected and future seasons"),callback_data="Season: Future and selected")]]
                 for s in seasons:
                     if s in selectedSeasons: 
@@ -776,11 +916,8 @@ async def checkSeasons(update, context):
 
                 markup = InlineKeyboardMarkup(keyboard)
 
-                await context.bot.edit_message_text(
-                    message_id=context.user_data["update_msg"],
-                    chat_id=update.effective_message.chat_id,
-                    text=i18n.t("addarr.Select from which season"),
-                    reply_markup=markup,
+                await carousel.editMessage(
+                    context, update.effective_message.chat_id, i18n.t("addarr.Select from which season"), markup
                 )
                 return SELECT_SEASONS
             
@@ -790,16 +927,18 @@ async def checkSeasons(update, context):
             )
             return await checkSeasons(update, context)
         
+@metrics.timed
 async def addSerieMovie(update, context):
-    position = context.user_data["position"]
-    choice = context.user_data["choice"]
-    idnumber = context.user_data["output"][position]["id"]
-    path = context.user_data["path"]
-    service = getService(context)
+    conversation = state.get(context)
+    choice = conversation.choice
+    path = conversation.path
+    result = await conversation.result(getSearchService(context))
+    idnumber = result.id
+    instance = getInstance(context)
     
     if choice == i18n.t("addarr.Series"):
-        seasons = context.user_data["seasons"]
-        selectedSeasons = context.user_data["selectedSeasons"]
+        seasons = conversation.seasons
+        selectedSeasons = conversation.selectedSeasons
         seasonsSelected = []
         for s in seasons:
             monitored = False
@@ -814,48 +953,38 @@ async def addSerieMovie(update, context):
             )
         logger.debug(f"Seasons {seasonsSelected} have been selected.")
     
-    qualityProfile = context.user_data["qualityProfile"]
+    qualityProfile = conversation.qualityProfile
 
-    #Add tag for user 
-    #TODO (creation does not work right now, creation should be manual)
+    #Add tag for user
     tags = []
-    if service.config.get("addRequesterIdTag"):
-        if str(update.effective_message.chat.id) not in [str(t["label"]) for t in service.getTags()]:
-            service.createTag(str(update.effective_message.chat.id))
-        logger.debug(f"Message : {update.effective_message}")
-        for t in service.getTags():
-            logger.debug(f"TAG {t} check")
-            if str(t["label"]) == str(update.effective_message.chat.id):
-                tags.append(str(t["id"]))
+    if instance.config.get("addRequesterIdTag"):
+        tagId = await instance.getTagId(update.effective_message.chat.id, create=True)
+        if tagId is not None:
+            tags.append(tagId)
     if not tags:
-        tags = [int(t["id"]) for t in service.getTags() if t["label"] in service.config.get("defaultTags", [])]
+        tags = await instance.getDefaultTagIds()
     logger.debug(f"Tags {tags} have been selected.")
     
-    if not service.inLibrary(idnumber):
+    lookup = result.lookup
+    if not await instance.inLibrary(idnumber):
         if choice == i18n.t("addarr.Movie"):
-            added = service.addToLibrary(idnumber, path, qualityProfile, tags)
+            added = await instance.addToLibrary(idnumber, path, qualityProfile, tags, lookup=lookup)
         else:
-            added = service.addToLibrary(idnumber, path, qualityProfile, tags, seasonsSelected)
+            added = await instance.addToLibrary(idnumber, path, qualityProfile, tags, seasonsSelected, lookup=lookup)
         
         if added:
             if choice == i18n.t("addarr.Movie"):
                 message=i18n.t("addarr.messages.AddSuccess", subjectWithArticle=i18n.t("addarr.MovieWithArticle"))
             else:
                 message=i18n.t("addarr.messages.AddSuccess", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"))
-            await context.bot.edit_message_text(
-                message_id=context.user_data["update_msg"],
-                chat_id=update.effective_message.chat_id,
-                text=message,
-            )
+            await carousel.editMessage(context, update.effective_message.chat_id, message)
             if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
                 adminNotifyId = config.get("adminNotifyId")
                 if choice == i18n.t("addarr.Movie"):
-                    message2=i18n.t("addarr.Notifications.AddSuccess", subjectWithArticle=i18n.t("addarr.MovieWithArticle"),title=context.user_data['output'][position]['title'],first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
+                    message2=i18n.t("addarr.Notifications.AddSuccess", subjectWithArticle=i18n.t("addarr.MovieWithArticle"),title=result.title,first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
                 else:
-                    message2=i18n.t("addarr.Notifications.AddSuccess", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"),title=context.user_data['output'][position]['title'],first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-                await context.bot.send_message(
-                    chat_id=adminNotifyId, text=message2
-                )
+                    message2=i18n.t("addarr.Notifications.AddSuccess", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"),title=result.title,first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
+                sendqueue.notify(context.bot, adminNotifyId, message2)
             clearUserData(context)
             return ConversationHandler.END
         else:
@@ -863,57 +992,68 @@ async def addSerieMovie(update, context):
                 message=i18n.t("addarr.messages.AddFailed", subjectWithArticle=i18n.t("addarr.MovieWithArticle").lower())
             else:
                 message=i18n.t("addarr.messages.AddFailed", subjectWithArticle=i18n.t("addarr.SeriesWithArticle").lower())
-            await context.bot.edit_message_text(
-                message_id=context.user_data["update_msg"],
-                chat_id=update.effective_message.chat_id,
-                text=message,
-            )
+            await carousel.editMessage(context, update.effective_message.chat_id, message)
             if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
                 adminNotifyId = config.get("adminNotifyId")
                 if choice == i18n.t("addarr.Movie"):
-                    message2=i18n.t("addarr.Notifications.AddFailed", subjectWithArticle=i18n.t("addarr.MovieWithArticle"),title=context.user_data['output'][position]['title'],first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
+                    message2=i18n.t("addarr.Notifications.AddFailed", subjectWithArticle=i18n.t("addarr.MovieWithArticle"),title=result.title,first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
                 else:
-                    message2=i18n.t("addarr.Notifications.AddFailed", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"),title=context.user_data['output'][position]['title'],first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-                await context.bot.send_message(
-                    chat_id=adminNotifyId, text=message2
-                )
+                    message2=i18n.t("addarr.Notifications.AddFailed", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"),title=result.title,first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
+                sendqueue.notify(context.bot, adminNotifyId, message2)
             clearUserData(context)
             return ConversationHandler.END
     else:
+        return await alreadyInLibrary(update, context, result)
+
+
+async def alreadyInLibrary(update, context, result):
+    choice = state.get(context).choice
+    if choice == i18n.t("addarr.Movie"):
+        message=i18n.t("addarr.messages.Exist", subjectWithArticle=i18n.t("addarr.MovieWithArticle"))
+    else:
+        message=i18n.t("addarr.messages.Exist", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"))
+    await carousel.editMessage(context, update.effective_message.chat_id, message)
+        
+    if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
+        adminNotifyId = config.get("adminNotifyId")
         if choice == i18n.t("addarr.Movie"):
-            message=i18n.t("addarr.messages.Exist", subjectWithArticle=i18n.t("addarr.MovieWithArticle"))
+            message2=i18n.t("addarr.Notifications.Exist", subjectWithArticle=i18n.t("addarr.MovieWithArticle"),title=result.title,first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
         else:
-            message=i18n.t("addarr.messages.Exist", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"))
-        await context.bot.edit_message_text(
-            message_id=context.user_data["update_msg"],
-            chat_id=update.effective_message.chat_id,
-            text=message,
-        )
-            
-        if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
-            adminNotifyId = config.get("adminNotifyId")
-            if choice == i18n.t("addarr.Movie"):
-                message2=i18n.t("addarr.Notifications.Exist", subjectWithArticle=i18n.t("addarr.MovieWithArticle"),title=context.user_data['output'][position]['title'],first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-            else:
-                message2=i18n.t("addarr.Notifications.Exist", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"),title=context.user_data['output'][position]['title'],first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-            await context.bot.send_message(
-                chat_id=adminNotifyId, text=message2
-            )
-        clearUserData(context)
-        return ConversationHandler.END
+            message2=i18n.t("addarr.Notifications.Exist", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"),title=result.title,first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
+        sendqueue.notify(context.bot, adminNotifyId, message2)
+    clearUserData(context)
+    return ConversationHandler.END
+
+
+# What the results of the conversation are searched with
+def getSearchService(context):
+    return unified if state.get(context).unified else getService(context)
 
 
+# The instance the add goes to, the first one until the user picked another
+def getInstance(context):
+    return getService(context).getInstance(state.get(context).instance)
+
+
+# Unified search results carry their kind, the service of the current result is
+# the one the add goes to
 def getService(context):
-    if context.user_data.get("choice") == i18n.t("addarr.Series"):
+    conversation = state.get(context)
+    result = conversation.cached(conversation.position)
+    if result is not None and result.kind is not None:
+        return unified.serviceOf(result)
+    choice = conversation.choice
+    if choice == i18n.t("addarr.Series"):
         return sonarr
-    elif context.user_data.get("choice") == i18n.t("addarr.Movie"):
+    elif choice == i18n.t("addarr.Movie"):
         return radarr
     else:
         raise ValueError(
-            f"Cannot determine service based on unknown or missing choice: {context.user_data.get('choice')}."
+            f"Cannot determine service based on unknown or missing choice: {choice}."
         )
 
 
+@metrics.timed
 async def help(update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
@@ -926,6 +1066,7 @@ async def help(update, context):
             authenticate=config["entrypointAuth"],
             add=config["entrypointAdd"],
             delete=config["entrypointDelete"],
+            batch=config["entrypointBatch"],
             movie=i18n.t("addarr.Movie").lower(),
             serie=i18n.t("addarr.Series").lower(),
             allSeries=config["entrypointAllSeries"],
@@ -938,15 +1079,9 @@ async def help(update, context):
 
 
 def clearUserData(context):
-    logger.debug(
-        "Removing choice, title, position, paths, and output from context.user_data..."
-    )
-    for x in [
-        x
-        for x in ["choice", "title", "position", "output", "paths", "path", "qualityProfiles", "qualityProfile", "update_msg", "title_update_msg", "photo_update_msg", "selectedSeasons", "seasons"]
-        if x in context.user_data.keys()
-    ]:
-        context.user_data.pop(x)
+    logger.debug("Removing the conversation state from context.user_data...")
+    prefetch.cancel(context)
+    state.clear(context)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,13 @@
+import math
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ConversationHandler
 import logging
 import logger
+import metrics
 
-from commons import authentication, checkAllowed, checkId, format_long_list_message
+from commons import MAX_MESSAGE_LENGTH, authentication, checkAllowed, checkId, formatListItem
 from config import config
 from translations import i18n
 import radarr as radarr
@@ -12,14 +17,20 @@ import sonarr as sonarr
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr.radarr", logLevel, config.get("logToConsole", False))
 
+PAGE_SIZE = 15  # items per page
+ITEM_LENGTH = MAX_MESSAGE_LENGTH // PAGE_SIZE  # longer items are cut, so a page always fits one message
+JUMP_SIZE = 10  # pages skipped by the jump buttons
+ALL_SERIES, ALL_MOVIES = "AllSeries", "AllMovies"
+
 
+@metrics.timed
 async def allSeries(update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
         logger.info("Allowlist is enabled, but userID isn't added into 'allowlist.txt'. So bot stays silent")
         return ConversationHandler.END
 
-    if sonarr.config.get("adminRestrictions") and not checkAllowed(update,"admin"):
+    if sonarr.default.config.get("adminRestrictions") and not checkAllowed(update,"admin"):
         await context.bot.send_message(
             chat_id=update.effective_message.chat_id,
             text=i18n.t("addarr.NotAdmin"),
@@ -32,56 +43,96 @@ async def allSeries(update, context):
         ):  # To also stop the beginning command
             return ConversationHandler.END
     else:
-        result = sonarr.allSeries()
-        content = format_long_list_message(result)
-
-        if isinstance(content, str):
-            await context.bot.send_message(
-                chat_id=update.effective_message.chat_id,
-                text=content,
-            )
-        else:
-            # print every substring
-            for subString in content:
-                await context.bot.send_message(
-                    chat_id=update.effective_message.chat_id,
-                    text=subString,
-                )
+        await showPage(update, context, ALL_SERIES, 0)
         return ConversationHandler.END
 
 
+@metrics.timed
 async def allMovies(update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
         logger.info("Allowlist is enabled, but userID isn't added into 'allowlist.txt'. So bot stays silent")
         return ConversationHandler.END
-        
-    if radarr.config.get("adminRestrictions") and not checkAllowed(update,"admin"):
+
+    if radarr.default.config.get("adminRestrictions") and not checkAllowed(update,"admin"):
         await context.bot.send_message(
             chat_id=update.effective_message.chat_id,
             text=i18n.t("addarr.NotAdmin"),
         )
         return ConversationHandler.END
-    
+
     if not checkId(update):
         if (
             await authentication(update, context) == "added"
         ):  # To also stop the beginning command
             return ConversationHandler.END
     else:
-        result = radarr.all_movies()
-        content = format_long_list_message(result)
-
-        if isinstance(content, str):
-            await context.bot.send_message(
-                chat_id=update.effective_message.chat_id,
-                text=content,
-            )
-        else:
-            # print every substring
-            for subString in content:
-                await context.bot.send_message(
-                    chat_id=update.effective_message.chat_id,
-                    text=subString,
-                )
-        return ConversationHandler.END
\ No newline at end of file
+        await showPage(update, context, ALL_MOVIES, 0)
+        return ConversationHandler.END
+
+
+@metrics.timed
+async def changePage(update, context):
+    query = update.callback_query
+    listName, page = query.data.split(": ")
+    service = sonarr if listName == ALL_SERIES else radarr
+    await query.answer()
+    if (
+        (config.get("enableAllowlist") and not checkAllowed(update, "regular"))
+        or (service.default.config.get("adminRestrictions") and not checkAllowed(update, "admin"))
+        or not checkId(update)
+    ):
+        return
+    await showPage(update, context, listName, int(page))
+
+
+def pageKeyboard(listName, page, pageCount):
+    def button(text, target):
+        return InlineKeyboardButton(text, callback_data=f"{listName}: {target}")
+
+    keyboard = [[
+        button("\U000023EE", 0),
+        button("\U000025C0", max(page - 1, 0)),
+        button(f"{page + 1}/{pageCount}", page),
+        button("\U000025B6", min(page + 1, pageCount - 1)),
+        button("\U000023ED", pageCount - 1),
+    ]]
+    if pageCount > JUMP_SIZE:
+        keyboard.append([
+            button(f"-{JUMP_SIZE}", max(page - JUMP_SIZE, 0)),
+            button(f"+{JUMP_SIZE}", min(page + JUMP_SIZE, pageCount - 1)),
+        ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def shorten(line):
+    return line if len(line) <= ITEM_LENGTH else line[:ITEM_LENGTH - 2] + "\u2026\n"
+
+
+# Render one page of the library and edit the message in place when paging
+async def showPage(update, context, listName, page):
+    if listName == ALL_SERIES:
+        items = await sonarr.allSeries()
+    else:
+        items = await radarr.all_movies()
+
+    pageCount = max(math.ceil(len(items) / PAGE_SIZE), 1)
+    page = min(max(page, 0), pageCount - 1)
+    text = "".join(shorten(formatListItem(item)) for item in items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+    if not text:
+        text = i18n.t("addarr.searchresults", count=0)
+    markup = pageKeyboard(listName, page, pageCount)
+
+    if update.callback_query is not None:
+        try:
+            await update.callback_query.edit_message_text(text=text, reply_markup=markup)
+        except BadRequest as e:
+            # Tapping the current page doesn't change anything
+            if "not modified" not in str(e):
+                raise
+    else:
+        await context.bot.send_message(
+            chat_id=update.effective_message.chat_id,
+            text=text,
+            reply_markup=markup,
+        )
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import re
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ConversationHandler
+
+import addarr
+import breaker
+import carousel
+import logger
+import metrics
+import radarr
+import sendqueue
+import state
+from commons import checkAllowed, checkId, format_bytes
+from config import config
+from translations import i18n
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.batch", logLevel, config.get("logToConsole", False))
+
+BATCH_TITLES, BATCH_CHOICE, BATCH_CONFIRM, BATCH_PATH, BATCH_QUALITY = range(5)
+
+MAX_TITLES = 25  # a keyboard with more buttons gets unwieldy
+WORKERS = 4  # lookups and adds running at the same time
+
+ID_PATTERN = re.compile(r"^(tmdb|tvdb|imdb):\s*(\w+)$", re.IGNORECASE)
+# Only a year in parentheses or after a comma, "Blade Runner 2049" is a title
+YEAR_PATTERN = re.compile(r"^(.+?)\s*(?:\(((?:18|19|20)\d{2})\)|,\s*((?:18|19|20)\d{2}))$")
+
+
+# "tmdb:603" -> ("tmdb:603", None), "The Matrix (1999)" -> ("The Matrix", 1999)
+def parseLine(line):
+    match = ID_PATTERN.match(line)
+    if match:
+        return f"{match.group(1).lower()}:{match.group(2)}", None
+    match = YEAR_PATTERN.match(line)
+    if match:
+        return match.group(1), int(match.group(2) or match.group(3))
+    return line, None
+
+
+def parseTitles(text):
+    lines = [line.strip() for line in text.splitlines()]
+    return [line for line in lines if line]
+
+
+@metrics.timed
+async def batch(update, context):
+    if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
+        #When using this mode, bot will remain silent if user is not in the allowlist.txt
+        logger.info("Allowlist is enabled, but userID isn't added into 'allowlist.txt'. So bot stays silent")
+        return ConversationHandler.END
+
+    if not checkId(update):
+        await context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=i18n.t("addarr.Authorize")
+        )
+        return ConversationHandler.END
+
+    addarr.clearUserData(context)
+    # The titles can follow the command in the same message
+    titles = parseTitles(update.message.text.partition("\n")[2])
+    if titles:
+        return await askChoice(update, context, titles)
+
+    await context.bot.send_message(
+        chat_id=update.effective_message.chat_id, text='\U0001F3F7 '+i18n.t("addarr.Batch.Titles")
+    )
+    return BATCH_TITLES
+
+
+@metrics.timed
+async def readTitles(update, context):
+    titles = parseTitles(update.message.text)
+    if not titles:
+        return BATCH_TITLES
+    return await askChoice(update, context, titles)
+
+
+async def askChoice(update, context, titles):
+    if len(titles) > MAX_TITLES:
+        await context.bot.send_message(
+            chat_id=update.effective_message.chat_id,
+            text=i18n.t("addarr.Batch.TooMany", count=MAX_TITLES),
+        )
+        titles = titles[:MAX_TITLES]
+    conversation = state.get(context)
+    conversation.batch = [state.BatchItem(line) for line in titles]
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                '\U0001F3AC '+i18n.t("addarr.Movie"),
+                callback_data=i18n.t("addarr.Movie")
+            ),
+            InlineKeyboardButton(
+                '\U0001F4FA '+i18n.t("addarr.Series"),
+                callback_data=i18n.t("addarr.Series")
+            ),
+        ],
+    ]
+    markup = InlineKeyboardMarkup(keyboard)
+    msg = await update.message.reply_text(i18n.t("addarr.What is this?"), reply_markup=markup)
+    conversation.messageId = msg.message_id
+    return BATCH_CHOICE
+
+
+@metrics.timed
+async def resolveTitles(update, context):
+    conversation = state.get(context)
+    conversation.choice = update.callback_query.data
+    service = addarr.getService(context)
+    # The library is checked in the instance addAll adds to
+    instance = addarr.getInstance(context)
+    chatId = update.effective_message.chat_id
+
+    await carousel.editMessage(context, chatId, i18n.t("addarr.Batch.Searching", count=len(conversation.batch)))
+    workers = asyncio.Semaphore(WORKERS)
+    conversation.batch = await asyncio.gather(
+        *(resolve(service, instance, item.line, workers) for item in conversation.batch)
+    )
+    return await showSelection(update, context)
+
+
+# Look a line up and take the first result, the first one of the right year if a year is given
+async def resolve(service, instance, line, workers):
+    term, year = parseLine(line)
+    try:
+        async with workers:
+            found = await service.search(term)
+        results = service.giveTitles(found) if found else []
+        if year is not None:
+            results = [r for r in results if r["year"] == year] or results
+        if not results:
+            return state.BatchItem(line)
+        result = state.Result(results[0])
+        return state.BatchItem(line, result, await instance.inLibrary(result.id))
+    except breaker.BackendUnavailable:
+        raise
+    except Exception as e:
+        logger.warning(f"Looking up '{line}' for a batch failed: {e}")
+        return state.BatchItem(line)
+
+
+async def showSelection(update, context):
+    conversation = state.get(context)
+    message = i18n.t("addarr.Batch.Confirm")
+    notFound = [item.line for item in conversation.batch if item.result is None]
+    inLibrary = [formatTitle(item.result) for item in conversation.batch if item.inLibrary]
+    if notFound:
+        message += "\n\n" + i18n.t("addarr.Batch.NotFound") + "\n" + "\n".join(notFound)
+    if inLibrary:
+        message += "\n\n" + i18n.t("addarr.Batch.InLibrary") + "\n" + "\n".join(inLibrary)
+
+    keyboard = []
+    for index, item in enumerate(conversation.batch):
+        if item.result is None or item.inLibrary:
+            continue
+        check = "\U00002705 " if item.selected else "\U00002B1C "
+        keyboard += [[InlineKeyboardButton(check + formatTitle(item.result), callback_data=f"Batch: {index}")]]
+    if any(item.selected for item in conversation.batch):
+        keyboard += [[InlineKeyboardButton('\U00002795 '+i18n.t("addarr.Batch.AddSelected"), callback_data="Batch: add")]]
+    keyboard += [[InlineKeyboardButton('\U0001F6D1 '+i18n.t("addarr.Stop"), callback_data=i18n.t("addarr.Stop"))]]
+
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, message, InlineKeyboardMarkup(keyboard)
+    )
+    return BATCH_CONFIRM
+
+
+def formatTitle(result):
+    return f"{result.title} ({result.year})"
+
+
+@metrics.timed
+async def toggleItem(update, context):
+    conversation = state.get(context)
+    try:
+        index = int(update.callback_query.data.replace("Batch: ", ""))
+    except ValueError:
+        index = -1
+    batch = conversation.batch or []
+    if not 0 <= index < len(batch) or batch[index].result is None or batch[index].inLibrary:
+        logger.debug(f"Callback query [{update.callback_query.data}] doesn't match any of the titles. Sending titles for selection...")
+        return await showSelection(update, context)
+    batch[index].selected = not batch[index].selected
+    return await showSelection(update, context)
+
+
+# The path, quality profile and tags are chosen once for the whole batch, which
+# goes to the first instance
+@metrics.timed
+async def choosePath(update, context):
+    service = addarr.getInstance(context)
+    conversation = state.get(context)
+    excluded = service.config.get("excludedRootFolders", [])
+    paths = [p for p in await service.getRootFolders() if p["path"] not in excluded]
+    conversation.paths = [p["path"] for p in paths]
+    if len(paths) == 1:
+        conversation.path = paths[0]["path"]
+        return await chooseQuality(update, context)
+
+    keyboard = []
+    for p in paths:
+        pathtxt = p['path']
+        if service.config.get("narrowRootFolderNames"):
+            pathtxt = p['path'].split("/")[-1]
+        keyboard += [[
+            InlineKeyboardButton(
+                f"Path: {pathtxt}, Free: {format_bytes(p['freeSpace'])}",
+                callback_data=f"Path: {p['path']}"
+            ),
+        ]]
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, i18n.t("addarr.Select a path"), InlineKeyboardMarkup(keyboard)
+    )
+    return BATCH_PATH
+
+
+@metrics.timed
+async def selectPath(update, context):
+    conversation = state.get(context)
+    path = update.callback_query.data.replace("Path: ", "").strip()
+    if path not in (conversation.paths or []):
+        return await choosePath(update, context)
+    conversation.path = path
+    return await chooseQuality(update, context)
+
+
+async def chooseQuality(update, context):
+    service = addarr.getInstance(context)
+    conversation = state.get(context)
+    excluded = service.config.get("excludedQualityProfiles", [])
+    qualityProfiles = [q for q in await service.getQualityProfiles() if q["name"] not in excluded]
+    conversation.qualityProfiles = [q["id"] for q in qualityProfiles]
+    if len(qualityProfiles) == 1:
+        conversation.qualityProfile = qualityProfiles[0]["id"]
+        return await addAll(update, context)
+
+    keyboard = []
+    for q in qualityProfiles:
+        keyboard += [[
+            InlineKeyboardButton(
+                f"Quality: {q['name']}",
+                callback_data=f"Quality profile: {q['id']}"
+            ),
+        ]]
+    await carousel.editMessage(
+        context, update.effective_message.chat_id, i18n.t("addarr.Select a quality"), InlineKeyboardMarkup(keyboard)
+    )
+    return BATCH_QUALITY
+
+
+@metrics.timed
+async def selectQuality(update, context):
+    conversation = state.get(context)
+    qualityProfile = int(update.callback_query.data.replace("Quality profile: ", "").strip())
+    if qualityProfile not in (conversation.qualityProfiles or []):
+        return await chooseQuality(update, context)
+    conversation.qualityProfile = qualityProfile
+    return await addAll(update, context)
+
+
+async def addAll(update, context):
+    conversation = state.get(context)
+    service = addarr.getInstance(context)
+    selected = [item for item in conversation.batch if item.selected]
+
+    tags = []
+    if service.config.get("addRequesterIdTag"):
+        tagId = await service.getTagId(update.effective_message.chat.id, create=True)
+        if tagId is not None:
+            tags.append(tagId)
+    if not tags:
+        tags = await service.getDefaultTagIds()
+
+    workers = asyncio.Semaphore(WORKERS)
+    await asyncio.gather(
+        *(add(service, item, conversation.path, conversation.qualityProfile, tags, workers) for item in selected)
+    )
+
+    summary = []
+    for key, outcome in [("Added", "added"), ("Failed", "failed"), ("InLibrary", "exists")]:
+        titles = [formatTitle(item.result) for item in selected if item.outcome == outcome]
+        if outcome == "exists":
+            titles += [formatTitle(item.result) for item in conversation.batch if item.inLibrary]
+        if titles:
+            summary.append(i18n.t(f"addarr.Batch.{key}") + "\n" + "\n".join(titles))
+    notFound = [item.line for item in conversation.batch if item.result is None]
+    if notFound:
+        summary.append(i18n.t("addarr.Batch.NotFound") + "\n" + "\n".join(notFound))
+    await carousel.editMessage(context, update.effective_message.chat_id, "\n\n".join(summary))
+
+    if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
+        sendqueue.notify(
+            context.bot,
+            config.get("adminNotifyId"),
+            i18n.t(
+                "addarr.Notifications.Batch",
+                count=sum(1 for item in selected if item.outcome == "added"),
+                first_name=update.effective_message.chat.first_name,
+                chat_id=update.effective_message.chat.id,
+            ),
+        )
+    addarr.clearUserData(context)
+    return ConversationHandler.END
+
+
+async def add(service, item, path, qualityProfile, tags, workers):
+    result = item.result
+    try:
+        async with workers:
+            if await service.inLibrary(result.id):
+                item.outcome = "exists"
+            elif isinstance(service, radarr.Radarr):
+                item.outcome = "added" if await service.addToLibrary(
+                    result.id, path, qualityProfile, tags, lookup=result.lookup
+                ) else "failed"
+            else:
+                # No season selection per series in a batch, all seasons are monitored
+                seasons = await service.getSeasons(result.id, result.lookup)
+                seasonsSelected = [{"seasonNumber": s["seasonNumber"], "monitored": True} for s in seasons]
+                item.outcome = "added" if await service.addToLibrary(
+                    result.id, path, qualityProfile, tags, seasonsSelected, lookup=result.lookup
+                ) else "failed"
+    except Exception as e:
+        logger.warning(f"Adding {result.title} of a batch failed: {e}")
+        item.outcome = "failed"
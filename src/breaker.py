@@ -0,0 +1,96 @@
+import logging
+import random
+import time
+
+import logger
+import metrics
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.breaker", logLevel, config.get("logToConsole", False))
+
+CLOSED, HALF_OPEN, OPEN = range(3)
+RETRY_BASE = 0.5  # seconds, the retries of a request wait a random time up to RETRY_BASE * 2^attempt
+RETRY_MAX = 5
+
+rejections = metrics.Counter("addarr_backend_rejected_total", "Requests not sent because the backend was unavailable")
+
+
+class BackendUnavailable(Exception):
+    def __init__(self, app):
+        super().__init__(f"{app} is unavailable")
+        self.app = app
+
+
+class CircuitBreaker:
+    """Stops sending requests to a backend after `failures` failed requests in a row.
+
+    While open, requests fail right away with BackendUnavailable. After
+    `resetTimeout` seconds one trial request is let through: if it succeeds the
+    breaker closes, if it fails the breaker stays open for another period.
+    """
+
+    def __init__(self, app, failures, resetTimeout):
+        self.app = app
+        self.failures = failures
+        self.resetTimeout = resetTimeout
+        self.failed = 0
+        self.openedAt = None
+        self.trial = False
+
+    @property
+    def state(self):
+        if self.openedAt is None:
+            return CLOSED
+        if self.trial or time.monotonic() - self.openedAt >= self.resetTimeout:
+            return HALF_OPEN
+        return OPEN
+
+    # Raises BackendUnavailable if the request shouldn't be sent
+    def check(self):
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self.trial:
+            self.trial = True
+            logger.info(f"Trying {self.app} again")
+            return
+        rejections.inc(backend=self.app)
+        raise BackendUnavailable(self.app)
+
+    def success(self):
+        if self.openedAt is not None:
+            logger.info(f"{self.app} is available again")
+        self.failed = 0
+        self.openedAt = None
+        self.trial = False
+
+    def failure(self):
+        self.failed += 1
+        if self.trial or (self.openedAt is None and self.failed >= self.failures):
+            logger.warning(f"{self.app} failed {self.failed} times in a row, pausing requests for {self.resetTimeout}s")
+            self.openedAt = time.monotonic()
+        self.trial = False
+
+    # The request ended without telling whether the backend works (it was cancelled)
+    def release(self):
+        self.trial = False
+
+    def isOpen(self):
+        return self.openedAt is not None
+
+
+breakers = {}
+
+
+def get(app):
+    breaker = breakers.get(app)
+    if breaker is None:
+        breaker = breakers[app] = CircuitBreaker(app, config["breakerFailures"], config["breakerResetTimeout"])
+    return breaker
+
+
+# Full jitter, so retries of several requests don't hit the backend at the same moment
+def retryDelay(attempt):
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** attempt))
@@ -0,0 +1,82 @@
+import logging
+
+from telegram import InputMediaPhoto
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+
+import logger
+import posters
+import state
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.carousel", logLevel, config.get("logToConsole", False))
+
+# The search results are shown in one message (messageId of the state): the
+# poster with the result as caption and the options as inline keyboard. Going
+# to the next result swaps the photo in place with edit_message_media.
+
+
+async def showResult(context, chatId, caption, markup, posterUrl):
+    conversation = state.get(context)
+    msgId = conversation.messageId
+    isPhoto = conversation.messageIsPhoto
+
+    if msgId is not None and isPhoto and posterUrl:
+        try:
+            msg = await context.bot.edit_message_media(
+                chat_id=chatId,
+                message_id=msgId,
+                media=InputMediaPhoto(
+                    media=posters.media(posterUrl), caption=caption, parse_mode=ParseMode.MARKDOWN
+                ),
+                reply_markup=markup,
+            )
+            await posters.remember(posterUrl, msg)
+            return
+        except BadRequest as e:
+            logger.debug(f"Swapping the poster failed, sending a new message: {e}")
+    elif msgId is not None and not isPhoto and not posterUrl:
+        await context.bot.edit_message_text(
+            chat_id=chatId, message_id=msgId, text=caption, parse_mode=ParseMode.MARKDOWN, reply_markup=markup
+        )
+        return
+
+    # A text message can't become a photo (or the other way around), so replace it
+    if msgId is not None:
+        try:
+            await context.bot.delete_message(chat_id=chatId, message_id=msgId)
+        except BadRequest as e:
+            logger.debug(f"Deleting message {msgId} failed: {e}")
+
+    msg = None
+    try:
+        msg = await posters.sendPoster(
+            context.bot, chatId, posterUrl, caption=caption, parse_mode=ParseMode.MARKDOWN, reply_markup=markup
+        )
+    except Exception as e:
+        logger.warning(f"Sending the poster failed: {e}")
+    if msg is None:
+        msg = await context.bot.send_message(
+            chat_id=chatId, text=caption, parse_mode=ParseMode.MARKDOWN, reply_markup=markup
+        )
+    conversation.messageId = msg.message_id
+    conversation.messageIsPhoto = bool(msg.photo)
+
+
+# Edit the text of the result message, which is the caption when it shows a poster
+async def editMessage(context, chatId, text, markup=None):
+    conversation = state.get(context)
+    msgId = conversation.messageId
+    if msgId is None:
+        msg = await context.bot.send_message(chat_id=chatId, text=text, reply_markup=markup)
+        conversation.messageId = msg.message_id
+    elif conversation.messageIsPhoto:
+        await context.bot.edit_message_caption(
+            chat_id=chatId, message_id=msgId, caption=text, reply_markup=markup
+        )
+    else:
+        await context.bot.edit_message_text(
+            chat_id=chatId, message_id=msgId, text=text, reply_markup=markup
+        )
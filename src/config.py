@@ -1,3 +1,5 @@
+import re
+
 import yaml
 
 from definitions import CONFIG_PATH, CONFIG_EXAMPLE_PATH, DEFAULT_SETTINGS
@@ -31,4 +33,29 @@ def checkConfigValues():
     languages = ["de-de", "en-us", "es-es", "fr-fr", "it-it", "nl-be", "pl-pl", "pt-pt", "ru-ru"]
     if config["language"] not in languages:
         wrongValues.append("language")
+    secretToken = config["webhook"].get("secretToken")
+    if secretToken and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", str(secretToken)):
+        wrongValues.append("webhook/secretToken")
     return wrongValues
+
+
+def mergeSettings(base, override):
+    merged = dict(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = mergeSettings(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+# Extra Radarr/Sonarr servers are listed under `instances` of the radarr/sonarr
+# section. Each is available as config["<kind>.<name>"], with the settings of the
+# section for everything it doesn't set itself.
+def instanceApps(kind):
+    apps = [kind]
+    shared = {key: value for key, value in config[kind].items() if key != "instances"}
+    for name, settings in (config[kind].get("instances") or {}).items():
+        app = f"{kind}.{name}"
+        config[app] = mergeSettings(shared, settings)
+        apps.append(app)
+    return apps
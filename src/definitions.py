@@ -6,18 +6,24 @@ from pathlib import Path
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.normpath(__file__)))
 
 # Set Projects Configuration path
-CONFIG_PATH = os.path.join(ROOT_DIR, "config.yaml")
+CONFIG_PATH = os.environ.get("ADDARR_CONFIG", os.path.join(ROOT_DIR, "config.yaml"))
 CONFIG_EXAMPLE_PATH = os.path.join(ROOT_DIR, "config_example.yaml")
 LANG_PATH = os.path.join(ROOT_DIR, "translations/")
 CHATID_PATH = os.path.join(ROOT_DIR, "chatid.txt")
 LOG_PATH = os.path.join(ROOT_DIR, "logs", "addarr.log")
 ADMIN_PATH = os.path.join(ROOT_DIR, "admin.txt")
 ALLOWLIST_PATH = os.path.join(ROOT_DIR, "allowlist.txt")
+ACL_DB_PATH = os.path.join(ROOT_DIR, "acl.sqlite")
+CACHE_PATH = os.path.join(ROOT_DIR, "cache")
+SEARCH_CACHE_PATH = os.path.join(CACHE_PATH, "search.sqlite")
+POSTER_CACHE_PATH = os.path.join(CACHE_PATH, "posters.sqlite")
+PERSISTENCE_PATH = os.path.join(CACHE_PATH, "conversations.sqlite")
 
 DEFAULT_SETTINGS = {
     "entrypointAuth": "auth", #auth or a custom entrypoint
     "entrypointAdd": "start", #start or a custom entrypoint
     "entrypointDelete": "delete", #start or a custom entrypoint
+    "entrypointBatch": "batch", #batch or a custom entrypoint
     "entrypointAllSeries": "allSeries", #allSeries or a custom entrypoint
     "entrypointAllMovies": "allMovies", #allSeries or a custom entrypoint
     "entrypointTransmission": "transmission", #transmission or a custom entrypoint
@@ -26,5 +32,21 @@ DEFAULT_SETTINGS = {
     "debugLogging": False,
     "language": "en-us",
     "transmission": { "enable": False },
-    "enableAdmin": False
+    "enableAdmin": False,
+    "libraryRefreshInterval": 900, #seconds between refreshes of the in-memory library index
+    "importInterval": 1, #seconds between the Radarr/Sonarr requests of a watchlist import
+    "metadataRefreshInterval": 300, #seconds between refreshes of root folders (free space) and quality profiles
+    "searchCacheTtl": 3600, #seconds a lookup result stays cached
+    "searchCacheSize": 256, #max number of cached lookups
+    "searchCacheOnDisk": False, #keep cached lookups in cache/search.sqlite across restarts
+    "posterCacheSize": 5000, #max number of remembered Telegram file_ids of posters
+    "metrics": { "enable": False }, #serve Prometheus metrics on http://<listen>:<port>/metrics
+    "webhook": { "enable": False }, #receive updates on a webhook instead of polling
+    "persistence": True, #keep unfinished conversations in cache/conversations.sqlite across restarts
+    "persistenceInterval": 5, #seconds between writes of changed conversations
+    "breakerFailures": 5, #failed requests in a row before a backend is considered down
+    "breakerResetTimeout": 30, #seconds before trying a backend that is down again
+    "getRetries": 2, #extra attempts of a failed GET request, after a random (jittered) wait
+    "unifiedSearch": False, #search movies and series together instead of asking which one first
+    "aclDatabase": False, #keep chatids, admins and allowlist in acl.sqlite instead of the text files
 }
@@ -1,9 +1,13 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.constants import ParseMode
 from telegram.ext import ConversationHandler
 
 import logging
 import logger
+import carousel
+import instances
+import metrics
+import sendqueue
+import state
 
 from commons import authentication, checkAllowed, checkId
 from config import config
@@ -16,8 +20,10 @@ from addarr import getService, clearUserData, stop
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr.radarr", logLevel, config.get("logToConsole", False))
 
-SERIE_MOVIE_DELETE, READ_DELETE_CHOICE,GIVE_OPTION = range(3)
+SERIE_MOVIE_DELETE, READ_DELETE_CHOICE,GIVE_OPTION, DELETE_INSTANCE = range(4)
+ALL_INSTANCES = "all"  # callback data of the button deleting it everywhere
 
+@metrics.timed
 async def delete(update : Update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
@@ -45,7 +51,7 @@ async def delete(update : Update, context):
         return SERIE_MOVIE_DELETE
 
     if reply == i18n.t("addarr.New").lower():
-        logger.debug("User issued New command, so clearing user_data")
+        logger.debug("User issued New command, so clearing the conversation state")
         clearUserData(context)
     
     await context.bot.send_message(
@@ -54,27 +60,19 @@ async def delete(update : Update, context):
     if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
         adminNotifyId = config.get("adminNotifyId")
         message2=i18n.t("addarr.Notifications.Delete", first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id)
-        await context.bot.send_message(
-            chat_id=adminNotifyId, text=message2
-    )
+        sendqueue.notify(context.bot, adminNotifyId, message2)
     return SERIE_MOVIE_DELETE
     
 
+@metrics.timed
 async def choiceDeleteSerieMovie(update, context):
-    service = getService(context)
-    if service.config.get("adminRestrictions") and not checkAllowed(update, context, "admin"):
-        await context.bot.send_message(
-            chat_id=update.effective_message.chat_id,
-            text=i18n.t("addarr.NotAdmin"),
-        )
-        return ConversationHandler.END
     if not checkId(update):
         if (
-            authentication(update, context) == "added"
+            await authentication(update, context) == "added"
         ):  # To also stop the beginning command
             return ConversationHandler.END
     elif update.message.text.lower() == "/stop".lower() or update.message.text.lower() == "stop".lower():
-        return stop(update, context)
+        return await stop(update, context)
     else:
         if update.message is not None:
             reply = update.message.text
@@ -90,16 +88,16 @@ async def choiceDeleteSerieMovie(update, context):
             logger.debug(
                 f"User entered a title {reply}"
             )
-            context.user_data["title"] = reply
+            state.get(context).title = reply
 
-        if context.user_data.get("choice") in [
+        if state.get(context).choice in [
             i18n.t("addarr.Series"),
             i18n.t("addarr.Movie"),
         ]:
             logger.debug(
-                f"user_data[choice] is {context.user_data['choice']}, skipping step of selecting movie/series"
+                f"Choice is {state.get(context).choice}, skipping step of selecting movie/series"
             )
-            return await deleteSerieMovie(update, context)
+            return await confirmDelete(update, context)
         else:
             keyboard = [
                 [
@@ -120,114 +118,157 @@ async def choiceDeleteSerieMovie(update, context):
             ]
             markup = InlineKeyboardMarkup(keyboard)
             msg = await update.message.reply_text(i18n.t("addarr.What is this?"), reply_markup=markup)
-            context.user_data["update_msg"] = msg.message_id
+            state.get(context).messageId = msg.message_id
 
         return READ_DELETE_CHOICE
 
 
+@metrics.timed
 async def confirmDelete(update, context):
-    title = context.user_data["title"]
+    conversation = state.get(context)
 
-    if not context.user_data.get("choice"):
+    if not conversation.choice:
         choice = None
         if update.message is not None:
             choice = update.message.text
         elif update.callback_query is not None:
             choice = update.callback_query.data
-        context.user_data["choice"] = choice
+        conversation.choice = choice
     
-    choice = context.user_data["choice"]
-    context.user_data["position"] = 0
+    choice = conversation.choice
 
     service = getService(context)
-
-    position = context.user_data["position"]
-
-    searchResult = service.search(title)
-    if not searchResult:
-        await context.bot.send_message( 
-            chat_id=update.effective_message.chat_id, 
-            text=i18n.t("addarr.searchresults", count=0),
+    if service.default.config.get("adminRestrictions") and not checkAllowed(update, "admin"):
+        await context.bot.send_message(
+            chat_id=update.effective_message.chat_id,
+            text=i18n.t("addarr.NotAdmin"),
         )
         clearUserData(context)
         return ConversationHandler.END
-        
-    context.user_data["output"] = service.giveTitles(searchResult)
-    idnumber = context.user_data["output"][position]["id"]
-
-    if service.inLibrary(idnumber):
-        keyboard = [
-                [
-                    InlineKeyboardButton(
-                        '\U00002795 '+i18n.t("addarr.Delete"),
-                        callback_data=i18n.t("addarr.Delete")
-                    ),
-                ],[
-                    InlineKeyboardButton(
-                        '\U000023ED '+i18n.t("addarr.StopDelete"),
-                        callback_data=i18n.t("addarr.Stop")
-                    ),
-                ],[ 
-                    InlineKeyboardButton(
-                        '\U0001F50D '+i18n.t("addarr.New"),
-                        callback_data=i18n.t("addarr.New")
-                    ),
-                ]
-            ]
-        markup = InlineKeyboardMarkup(keyboard)
-        
-        message = f"\n\n*{context.user_data['output'][position]['title']} ({context.user_data['output'][position]['year']})*"
-        
-        if "update_msg" in context.user_data:
-            await context.bot.edit_message_text(
-                message_id=context.user_data["update_msg"],
-                chat_id=update.effective_message.chat_id,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN,
-            )
-        else:
-            msg = await context.bot.send_message(chat_id=update.effective_message.chat_id, text=message,parse_mode=ParseMode.MARKDOWN,)
-            context.user_data["update_msg"] = msg.message_id
-        try:
-            img = await context.bot.sendPhoto(
-                chat_id=update.effective_message.chat_id,
-                photo=context.user_data["output"][position]["poster"],
-            )
-        except:
-            context.user_data["photo_update_msg"] = None
-        else:
-            context.user_data["photo_update_msg"] = img.message_id
 
-        if choice == i18n.t("addarr.Movie"):
-            message=i18n.t("addarr.messages.ThisDelete", subjectWithArticle=i18n.t("addarr.MovieWithArticle").lower())
-        else:
-            message=i18n.t("addarr.messages.ThisDelete", subjectWithArticle=i18n.t("addarr.SeriesWithArticle").lower())
-        msg = await context.bot.send_message(
-            chat_id=update.effective_message.chat_id, text=message, reply_markup=markup
-        )
-        context.user_data["title_update_msg"] = context.user_data["update_msg"]
-        context.user_data["update_msg"] = msg.message_id
-    else:
+    # Only what is in the library can be deleted, so the library index is searched
+    # instead of looking the title up in Radarr/Sonarr
+    matches = await service.searchLibrary(conversation.title)
+    if not matches:
         if choice == i18n.t("addarr.Movie"):
             message=i18n.t("addarr.messages.NoExist", subjectWithArticle=i18n.t("addarr.MovieWithArticle"))
         else:
             message=i18n.t("addarr.messages.NoExist", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"))
-        await context.bot.edit_message_text(
-            message_id=context.user_data["update_msg"],
-            chat_id=update.effective_message.chat_id,
-            text=message,
-        )
+        await carousel.editMessage(context, update.effective_message.chat_id, message)
+        clearUserData(context)
+        return ConversationHandler.END
+
+    conversation.setResults(matches)
+    return await showMatch(update, context)
+
+
+@metrics.timed
+async def nextMatch(update, context):
+    state.get(context).position += 1
+    return await showMatch(update, context)
+
+
+async def showMatch(update, context):
+    conversation = state.get(context)
+    service = getService(context)
+    result = await conversation.result(LibrarySearch(service))
+    if result is None:
+        await carousel.editMessage(context, update.effective_message.chat_id, i18n.t("addarr.searchresults", count=0))
         clearUserData(context)
         return ConversationHandler.END
+
+    keyboard = [
+            [
+                InlineKeyboardButton(
+                    '\U00002795 '+i18n.t("addarr.Delete"),
+                    callback_data=i18n.t("addarr.Delete")
+                ),
+            ]
+        ]
+    if conversation.hasNext():
+        keyboard += [
+            [
+                InlineKeyboardButton(
+                    '\U000023ED '+i18n.t("addarr.Next result"),
+                    callback_data=i18n.t("addarr.Next result")
+                ),
+            ]
+        ]
+    keyboard += [
+            [
+                InlineKeyboardButton(
+                    '\U000023ED '+i18n.t("addarr.StopDelete"),
+                    callback_data=i18n.t("addarr.Stop")
+                ),
+            ],[
+                InlineKeyboardButton(
+                    '\U0001F50D '+i18n.t("addarr.New"),
+                    callback_data=i18n.t("addarr.New")
+                ),
+            ]
+        ]
+    markup = InlineKeyboardMarkup(keyboard)
+
+    message = f"*{result.title} ({result.year})*\n\n"
+    if conversation.choice == i18n.t("addarr.Movie"):
+        message+=i18n.t("addarr.messages.ThisDelete", subjectWithArticle=i18n.t("addarr.MovieWithArticle").lower())
+    else:
+        message+=i18n.t("addarr.messages.ThisDelete", subjectWithArticle=i18n.t("addarr.SeriesWithArticle").lower())
+    if len(service.instances) > 1:
+        message += "\n\n" + instances.libraryBadges(service.instances, await service.libraryInstances(result.id))
+    await carousel.showResult(context, update.effective_message.chat_id, message, markup, result.poster)
     return GIVE_OPTION
 
+
+@metrics.timed
 async def deleteSerieMovie(update, context):  
-    choice = context.user_data["choice"]  
-    position = context.user_data["position"]
+    conversation = state.get(context)
+    service = getService(context)
+    idnumber = (await conversation.result(LibrarySearch(service))).id
+    having = [i for i in service.instances if i.library.items.get(idnumber) is not None]
+    if len(having) <= 1:
+        return await removeFrom(update, context, idnumber, having)
+
+    # Files are deleted too, so it's only deleted everywhere when asked for
+    keyboard = [
+        [InlineKeyboardButton(i.name, callback_data=f"Instance: {i.app}")]
+        for i in having
+    ]
+    keyboard += [
+        [InlineKeyboardButton(i18n.t("addarr.All instances"), callback_data=f"Instance: {ALL_INSTANCES}")],
+        [InlineKeyboardButton('\U000023ED '+i18n.t("addarr.StopDelete"), callback_data=i18n.t("addarr.Stop"))],
+    ]
+    await carousel.editMessage(
+        context, update.effective_message.chat_id,
+        i18n.t("addarr.Select an instance to delete from"), InlineKeyboardMarkup(keyboard)
+    )
+    return DELETE_INSTANCE
+
+
+@metrics.timed
+async def selectDeleteInstance(update, context):
+    conversation = state.get(context)
     service = getService(context)
-    idnumber = context.user_data["output"][position]["id"]
+    idnumber = (await conversation.result(LibrarySearch(service))).id
+    app = update.callback_query.data.replace("Instance: ", "").strip()
+    having = [i for i in service.instances if i.library.items.get(idnumber) is not None]
+    if app != ALL_INSTANCES:
+        having = [i for i in having if i.app == app]
+        if not having:
+            logger.debug(f"Callback query [{app}] doesn't match any of the instances. Sending instances for selection...")
+            return await deleteSerieMovie(update, context)
+    return await removeFrom(update, context, idnumber, having)
+
 
-    if service.removeFromLibrary(idnumber):
+# Removes the item from the instances, with the database id the library index knows
+async def removeFrom(update, context, idnumber, targets):
+    choice = state.get(context).choice
+    removed = []
+    for instance in targets:
+        record = instance.library.items.get(idnumber)
+        if record is not None:
+            removed.append(await instance.removeFromLibrary(idnumber, record["id"]))
+    if removed and all(removed):
         if choice == i18n.t("addarr.Movie"):
             message=i18n.t("addarr.messages.DeleteSuccess", subjectWithArticle=i18n.t("addarr.MovieWithArticle"))
         else:
@@ -237,10 +278,16 @@ async def deleteSerieMovie(update, context):
             message=i18n.t("addarr.messages.DeleteFailed", subjectWithArticle=i18n.t("addarr.MovieWithArticle"))
         else:
             message=i18n.t("addarr.messages.DeleteFailed", subjectWithArticle=i18n.t("addarr.SeriesWithArticle"))
-    await context.bot.edit_message_text(
-            message_id=context.user_data["update_msg"],
-            chat_id=update.effective_message.chat_id,
-            text=message,
-    )
+    await carousel.editMessage(context, update.effective_message.chat_id, message)
     clearUserData(context)
     return ConversationHandler.END
+
+
+class LibrarySearch:
+    """Searches a conversation's results in the library index, for conversation.result"""
+
+    def __init__(self, service):
+        self.search = service.searchLibrary
+
+    def giveTitles(self, found):
+        return found
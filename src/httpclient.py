@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import re
+import time
+
+import httpx
+
+import breaker
+import commons
+import logger
+import metrics
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.httpclient", logLevel, config.get("logToConsole", False))
+
+DEFAULT_TIMEOUT = 10  # seconds, can be overridden with `timeout` in the service config
+LOOKUP_TIMEOUT = 30  # lookups go through TMDB/TVDB and are a lot slower
+LIBRARY_TIMEOUT = 120  # a whole library can take a while before the first byte
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 5
+
+# One pooled client per backend (radarr, sonarr, each extra instance like radarr.4k, sabnzbd)
+clients = {}
+
+
+def getClient(app):
+    client = clients.get(app)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(getTimeout(app)),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            headers={"Accept-Encoding": "gzip"},
+        )
+        clients[app] = client
+    return client
+
+
+def getTimeout(app):
+    return config.get(app, {}).get("timeout") or DEFAULT_TIMEOUT
+
+
+# Failed requests (no connection, timeout, 5xx) count for the circuit breaker of
+# the backend and GETs are retried. BackendUnavailable is raised when the backend
+# can't be reached or its breaker is open. With countTimeouts=False a timeout isn't
+# held against the backend, for slow background requests.
+async def request(method, app, endpoint, parameters={}, timeout=None, countTimeouts=True, **kwargs):
+    url = commons.generateApiQuery(app, endpoint, parameters)
+    logger.debug(f"{method} {app}/{endpoint}")
+    if timeout is None:
+        timeout = getTimeout(app)
+    circuit = breaker.get(app)
+    retries = config["getRetries"] if method == "GET" else 0
+    for attempt in range(retries + 1):
+        circuit.check()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await getClient(app).request(method, url, timeout=timeout, **kwargs)
+            status = response.status_code
+        except httpx.TransportError as e:
+            if countTimeouts or not isinstance(e, httpx.TimeoutException):
+                circuit.failure()
+            else:
+                circuit.release()
+            logger.warning(f"{method} {app}/{endpoint} failed: {e!r}")
+        except BaseException:
+            circuit.release()
+            raise
+        else:
+            if response.status_code < 500:
+                circuit.success()
+                return response
+            circuit.failure()
+            logger.warning(f"{method} {app}/{endpoint} answered {response.status_code}")
+        finally:
+            metrics.backendLatency.observe(
+                time.perf_counter() - start,
+                backend=app,
+                endpoint=re.sub(r"/\d+", "/{id}", endpoint),  # keep the number of series small
+                method=method,
+                status=status,
+            )
+        if attempt == retries or circuit.isOpen():
+            break
+        await asyncio.sleep(breaker.retryDelay(attempt))
+    raise breaker.BackendUnavailable(app)
+
+
+async def get(app, endpoint, parameters={}, timeout=None, countTimeouts=True):
+    return await request("GET", app, endpoint, parameters, timeout, countTimeouts)
+
+
+async def post(app, endpoint, json, parameters={}, timeout=None):
+    return await request("POST", app, endpoint, parameters, timeout, json=json)
+
+
+async def delete(app, endpoint, parameters={}, timeout=None):
+    return await request("DELETE", app, endpoint, parameters, timeout)
+
+
+async def closeClients(application=None):
+    for app, client in list(clients.items()):
+        await client.aclose()
+        clients.pop(app)
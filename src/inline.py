@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import ConversationHandler
+
+import acl
+import addarr
+import logger
+import metrics
+import radarr
+import sendqueue
+import sonarr
+import state
+from commons import checkAllowed, checkId
+from config import config
+from translations import i18n
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.inline", logLevel, config.get("logToConsole", False))
+
+DEBOUNCE = 0.4  # seconds a query has to stay unchanged before it's looked up
+CACHE_TIME = 60  # seconds Telegram may answer the same query of the same user by itself
+MIN_LENGTH = 2
+MAX_RESULTS = 50  # the most Telegram accepts in one answer
+
+# The message a chosen result sends, e.g. "/start tmdb:27205 Inception (2010)"
+RESULT_PATTERN = re.compile(r"^/" + config["entrypointAdd"] + r" (tmdb|tvdb):(\d+)", re.IGNORECASE)
+
+pending = {}  # user id -> lookup of their latest query
+answers = OrderedDict()  # user id -> {"term": query, "tmdb": movies, "tvdb": series} they were last shown
+MAX_ANSWERS = 100
+
+
+def isAllowed(update):
+    if config.get("enableAllowlist") and not checkAllowed(update, "regular"):
+        return False
+    # Inline queries have no chat, the private chat with the bot has the id of the user
+    return acl.chats.contains(update.effective_user.id)
+
+
+@metrics.timed
+async def inlineQuery(update, context):
+    query = update.inline_query
+    userId = query.from_user.id
+
+    # Every keystroke is a new query, only the latest one is worth answering
+    previous = pending.pop(userId, None)
+    if previous is not None:
+        previous.cancel()
+
+    if not isAllowed(update) or len(query.query.strip()) < MIN_LENGTH:
+        await query.answer([], cache_time=CACHE_TIME, is_personal=True)
+        return
+
+    task = asyncio.create_task(answer(query))
+    pending[userId] = task
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.debug(f"Inline query '{query.query}' was superseded")
+    finally:
+        if pending.get(userId) is task:
+            del pending[userId]
+
+
+async def answer(query):
+    await asyncio.sleep(DEBOUNCE)
+    term = query.query.strip()
+    movies, series = await asyncio.gather(lookup(radarr, term), lookup(sonarr, term))
+
+    # Share the results between movies and series, leftover room goes to the other one
+    movieCount = max(MAX_RESULTS // 2, MAX_RESULTS - len(series))
+    movies = movies[:movieCount]
+    series = series[:MAX_RESULTS - len(movies)]
+
+    answers[query.from_user.id] = {"term": term, "tmdb": movies, "tvdb": series}
+    answers.move_to_end(query.from_user.id)
+    while len(answers) > MAX_ANSWERS:
+        answers.popitem(last=False)
+
+    results = [article("tmdb", item, '\U0001F3AC '+i18n.t("addarr.Movie")) for item in movies]
+    results += [article("tvdb", item, '\U0001F4FA '+i18n.t("addarr.Series")) for item in series]
+    await query.answer(results, cache_time=CACHE_TIME, is_personal=True)
+
+
+async def lookup(service, term):
+    try:
+        found = await service.search(term)
+    except Exception as e:
+        logger.warning(f"Inline lookup of '{term}' failed: {e}")
+        return []
+    return service.giveTitles(found) if found else []
+
+
+def article(prefix, item, kind):
+    return InlineQueryResultArticle(
+        id=f"{prefix}:{item['id']}",
+        title=f"{item['title']} ({item['year']})",
+        description=f"{kind}\n{item.get('overview') or ''}"[:200],
+        thumbnail_url=item["poster"],
+        input_message_content=InputTextMessageContent(
+            f"/{config['entrypointAdd']} {prefix}:{item['id']} {item['title']} ({item['year']})"
+        ),
+    )
+
+
+# Entrypoint of the add conversation for a chosen inline result, shows that result right away
+@metrics.timed
+async def startFromResult(update, context):
+    if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
+        #When using this mode, bot will remain silent if user is not in the allowlist.txt
+        logger.info("Allowlist is enabled, but userID isn't added into 'allowlist.txt'. So bot stays silent")
+        return ConversationHandler.END
+
+    if not checkId(update):
+        await context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=i18n.t("addarr.Authorize")
+        )
+        return ConversationHandler.END
+
+    prefix, externalId = RESULT_PATTERN.match(update.message.text).groups()
+    prefix, externalId = prefix.lower(), int(externalId)
+    addarr.clearUserData(context)
+    conversation = state.get(context)
+    conversation.choice = i18n.t("addarr.Movie") if prefix == "tmdb" else i18n.t("addarr.Series")
+    service = addarr.getService(context)
+
+    # Keep the other results of the query, so "Next result" still works
+    last = answers.get(update.effective_user.id, {})
+    output = last.get(prefix, [])
+    position = next((i for i, item in enumerate(output) if item["id"] == externalId), None)
+    conversation.title = last.get("term")
+    if position is None:
+        # Not in the last answer (or the bot restarted since), Radarr/Sonarr look up "tmdb:"/"tvdb:" terms by id
+        conversation.title = f"{prefix}:{externalId}"
+        found = await service.search(conversation.title)
+        output = service.giveTitles(found) if found else []
+        position = 0
+    if not output:
+        await context.bot.send_message(
+            chat_id=update.effective_message.chat_id,
+            text=i18n.t("addarr.searchresults", count=0),
+        )
+        addarr.clearUserData(context)
+        return ConversationHandler.END
+
+    if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
+        adminNotifyId = config.get("adminNotifyId")
+        sendqueue.notify(context.bot, adminNotifyId, i18n.t("addarr.Notifications.Start", first_name=update.effective_message.chat.first_name, chat_id=update.effective_message.chat.id))
+
+    conversation.setResults(output, position)
+    return await addarr.showResult(update, context)
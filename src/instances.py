@@ -0,0 +1,152 @@
+import asyncio
+import logging
+
+from telegram.helpers import escape_markdown
+
+import logger
+from config import config, instanceApps
+from library import LibraryIndex
+from metadata import qualityProfileCache, rootFolderCache
+from tags import TagCache
+from translations import i18n
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.instances", logLevel, config.get("logToConsole", False))
+
+
+class Instance:
+    """One Radarr or Sonarr server. `app` is its key in the config ("radarr",
+    "radarr.4k", ...) and of its connection pool, circuit breaker and caches."""
+
+    def __init__(self, app, endpoint, idField):
+        self.app = app
+        self.config = config[app]
+        kind, _, name = app.partition(".")
+        self.name = str(self.config.get("name") or name or kind.capitalize())
+        self.tagCache = TagCache(app)
+        self.rootFolders = rootFolderCache(app)
+        self.qualityProfiles = qualityProfileCache(app)
+        self.library = LibraryIndex(app, endpoint, idField)
+        byApp[app] = self
+
+    async def inLibrary(self, externalId):
+        return await self.library.contains(externalId)
+
+    async def getRootFolders(self):
+        return await self.rootFolders.get()
+
+    async def getQualityProfiles(self):
+        return await self.qualityProfiles.get()
+
+    async def getTagId(self, label, create=False):
+        return await self.tagCache.getId(label, create)
+
+    async def getDefaultTagIds(self):
+        return await self.tagCache.getDefaultIds()
+
+    async def getDbId(self, externalId):
+        return await self.library.getDbId(externalId)
+
+    async def sortedItems(self):
+        # Sorted snapshot of the library index, shared by everyone browsing
+        return await self.library.sortedItems()
+
+
+LIBRARY_MATCHES = 10  # matches of a library search kept per instance
+
+# All instances by app key
+byApp = {}
+
+
+def create(cls, kind):
+    return [cls(app) for app in instanceApps(kind)]
+
+
+# Name to show for an app key, also for the backends that aren't instances
+def nameOf(app):
+    instance = byApp.get(app)
+    return instance.name if instance is not None else app.capitalize()
+
+
+# One line with a mark per instance for whether it has the item, empty with only one instance
+def libraryBadges(instances, having):
+    if len(instances) < 2:
+        return ""
+    marks = [
+        ("\U00002705 " if instance in having else "\U00002B1C ") + escape_markdown(instance.name)
+        for instance in instances
+    ]
+    return i18n.t("addarr.In library", instances="  ".join(marks))
+
+
+# Run `call` on all instances at the same time. Instances that fail are left out,
+# unless all of them fail.
+async def fanOut(instances, call):
+    results = await asyncio.gather(*(call(instance) for instance in instances), return_exceptions=True)
+    answered = []
+    for instance, result in zip(instances, results):
+        if isinstance(result, BaseException):
+            if len(instances) == 1 or all(isinstance(r, BaseException) for r in results):
+                raise result
+            logger.warning(f"{instance.name} didn't answer: {result}")
+        else:
+            answered.append((instance, result))
+    return answered
+
+
+# One list of lookup results, in the order of the first instance, then what only the others found
+def mergeLookups(answered, idField):
+    merged = []
+    seen = set()
+    for _, found in answered:
+        for item in found or []:
+            if item.get(idField) not in seen:
+                seen.add(item.get(idField))
+                merged.append(item)
+    return merged
+
+
+# Titles in the libraries of the instances that look like `title`, each once and
+# best match first, as results of a conversation
+async def searchLibraries(instances, title):
+    answered = await fanOut(instances, lambda instance: instance.library.search(title, LIBRARY_MATCHES))
+    scores = {}
+    found = {}
+    for _, matches in answered:
+        for score, externalId, record in matches:
+            if score > scores.get(externalId, 0):
+                scores[externalId] = score
+                found[externalId] = {
+                    "id": externalId,
+                    "title": record["title"],
+                    "year": record["year"],
+                    "poster": record["poster"],
+                }
+    return sorted(found.values(), key=lambda item: -scores[item["id"]])
+
+
+# The libraries of all instances as one sorted list, each item once with the names
+# of the instances that have it
+class MergedLibrary:
+    def __init__(self):
+        self.snapshots = None
+        self.items = []
+
+    async def sortedItems(self, instances):
+        if len(instances) == 1:
+            return await instances[0].sortedItems()
+        snapshots = [await instance.sortedItems() for instance in instances]
+        if self.snapshots is None or any(a is not b for a, b in zip(snapshots, self.snapshots)):
+            byKey = {}
+            for instance, snapshot in zip(instances, snapshots):
+                for record in snapshot:
+                    key = (str(record["title"]).lower(), record["year"])
+                    if key not in byKey:
+                        byKey[key] = dict(record, instances=[])
+                    byKey[key]["instances"].append(instance.name)
+            self.items = sorted(
+                byKey.values(), key=lambda record: (str(record["title"]).lower(), record["year"] or 0)
+            )
+            self.snapshots = snapshots
+        return self.items
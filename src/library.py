@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+import httpclient
+import logger
+from config import config
+from titleindex import TitleIndex
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.library", logLevel, config.get("logToConsole", False))
+
+MISS_REFRESH_INTERVAL = 60  # seconds, ids missing from the index refresh it at most this often
+
+recordFields = ["title", "year", "monitored", "status", "imdbId"]
+
+
+def makeRecord(item):
+    record = {"id": item["id"]}
+    for key in recordFields:
+        record[key] = item.get(key)
+    # For finding the item by title and showing it in the delete flow
+    record["alternateTitles"] = [t["title"] for t in item.get("alternateTitles") or [] if t.get("title")]
+    record["poster"] = next(
+        (image.get("remoteUrl") for image in item.get("images") or [] if image.get("coverType") == "poster"), None
+    )
+    return record
+
+
+class LibraryIndex:
+    """In-memory index of everything in a Radarr/Sonarr library.
+
+    Maps the external id (tmdbId/tvdbId) to a small record holding the
+    database id, so membership and id lookups don't need a full download.
+    The titles are indexed as well, for searching the library itself.
+    """
+
+    def __init__(self, app, endpoint, idField):
+        self.app = app
+        self.endpoint = endpoint
+        self.idField = idField
+        self.items = {}
+        self.snapshot = None
+        self.titles = None
+        self.lastRefresh = None
+        self.lock = asyncio.Lock()
+
+    def isStale(self, maxAge=None):
+        if self.lastRefresh is None:
+            return True
+        if maxAge is None:
+            maxAge = config["libraryRefreshInterval"]
+        return time.monotonic() - self.lastRefresh > maxAge
+
+    # With `maxAge`, only refreshes when the index is older than that. It's checked
+    # again once the lock is held, so callers waiting on the same refresh don't
+    # download the library once more each.
+    async def refresh(self, maxAge=None):
+        async with self.lock:
+            if maxAge is not None and not self.isStale(maxAge):
+                return
+            # Slow on big libraries, and a slow background refresh mustn't open the breaker
+            req = await httpclient.get(
+                self.app, self.endpoint, {}, timeout=httpclient.LIBRARY_TIMEOUT, countTimeouts=False
+            )
+            req.raise_for_status()
+            self.items = {
+                item[self.idField]: makeRecord(item)
+                for item in req.json()
+                if self.idField in item
+            }
+            self.snapshot = None
+            self.titles = None
+            self.lastRefresh = time.monotonic()
+        logger.debug(f"Indexed {len(self.items)} items of {self.app}")
+
+    async def ensure(self):
+        if self.isStale():
+            await self.refresh(config["libraryRefreshInterval"])
+
+    async def contains(self, externalId):
+        await self.ensure()
+        return externalId in self.items
+
+    async def get(self, externalId):
+        await self.ensure()
+        record = self.items.get(externalId)
+        if record is None:
+            # Could've been added outside of Addarr since the last refresh
+            await self.refresh(MISS_REFRESH_INTERVAL)
+            record = self.items.get(externalId)
+        return record
+
+    async def getDbId(self, externalId):
+        record = await self.get(externalId)
+        return record["id"] if record else None
+
+    async def sortedItems(self):
+        await self.ensure()
+        if self.snapshot is None:
+            self.snapshot = sorted(
+                self.items.values(),
+                key=lambda record: (str(record["title"]).lower(), record["year"] or 0),
+            )
+        return self.snapshot
+
+    # Records in the library whose titles look like the query, with their external
+    # id and score, best match first
+    async def search(self, query, limit):
+        await self.ensure()
+        if self.titles is None:
+            self.titles = TitleIndex(self.items)
+        return [
+            (score, externalId, self.items[externalId])
+            for score, externalId in self.titles.search(query, limit)
+        ]
+
+    def add(self, item):
+        if self.idField in item and "id" in item:
+            self.items[item[self.idField]] = makeRecord(item)
+            self.snapshot = None
+            self.titles = None
+
+    def remove(self, externalId):
+        if self.items.pop(externalId, None) is not None:
+            self.snapshot = None
+            self.titles = None
+
+    async def refreshPeriodically(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Refreshing the {self.app} library index failed: {e}")
+            await asyncio.sleep(config["libraryRefreshInterval"])
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+import httpclient
+import logger
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.metadata", logLevel, config.get("logToConsole", False))
+
+
+class MetadataCache:
+    """Rarely changing metadata (root folders, quality profiles) of a backend.
+
+    Kept in memory and refreshed in the background, so the keyboards can be
+    built without a request.
+    """
+
+    def __init__(self, app, endpoint, fields):
+        self.app = app
+        self.endpoint = endpoint
+        self.fields = fields
+        self.data = None
+
+    async def refresh(self):
+        req = await httpclient.get(self.app, self.endpoint, {})
+        req.raise_for_status()
+        # Only keep what we use, root folders also hold big unmappedFolders lists
+        self.data = [{key: item.get(key) for key in self.fields} for item in req.json()]
+        logger.debug(f"Loaded {len(self.data)} items of {self.app}/{self.endpoint}")
+
+    async def get(self):
+        if self.data is None:
+            await self.refresh()
+        return self.data
+
+    async def refreshPeriodically(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Refreshing {self.app}/{self.endpoint} failed: {e}")
+            await asyncio.sleep(config["metadataRefreshInterval"])
+
+
+def rootFolderCache(app):
+    return MetadataCache(app, "Rootfolder", ["id", "path", "freeSpace", "accessible"])
+
+
+def qualityProfileCache(app):
+    return MetadataCache(app, "qualityProfile", ["id", "name"])
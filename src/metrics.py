@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import logging
+import time
+
+from telegram.request import HTTPXRequest
+
+import logger
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.metrics", logLevel, config.get("logToConsole", False))
+
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# All metrics, exported in the Prometheus text format
+registry = []
+server = None
+
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{formatLabels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.values.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{formatLabels(labels + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{formatLabels(labels + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{formatLabels(labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{formatLabels(labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time from a callback returning {labels: value} or a number"""
+
+    def __init__(self, name, help, callback):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.debug(f"Reading gauge {self.name} failed: {e}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            lines.append(f"{self.name}{formatLabels(labels)} {value}")
+        return lines
+
+
+handlerCalls = Counter("addarr_handler_calls_total", "Calls of the Telegram handlers")
+handlerErrors = Counter("addarr_handler_errors_total", "Telegram handlers that raised an exception")
+handlerLatency = Histogram("addarr_handler_seconds", "Time spent in the Telegram handlers")
+backendLatency = Histogram("addarr_backend_request_seconds", "Requests to Radarr, Sonarr and Sabnzbd")
+telegramLatency = Histogram("addarr_telegram_request_seconds", "Requests to the Telegram Bot API")
+sendQueueWait = Histogram("addarr_send_queue_wait_seconds", "Time requests to Telegram waited for the rate limits")
+sendRetries = Counter("addarr_send_retry_after_total", "RetryAfter errors of Telegram")
+
+
+# Decorator for handlers: counts calls and errors, and times them
+def timed(function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        handlerCalls.inc(handler=function.__name__)
+        try:
+            return await function(*args, **kwargs)
+        except Exception:
+            handlerErrors.inc(handler=function.__name__)
+            raise
+        finally:
+            handlerLatency.observe(time.perf_counter() - start, handler=function.__name__)
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every call to the Telegram Bot API"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            status = code
+            return code, payload
+        finally:
+            telegramLatency.observe(
+                time.perf_counter() - start, endpoint=url.rsplit("/", 1)[-1], status=status
+            )
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+async def serve(reader, writer):
+    try:
+        requestLine = await reader.readline()
+        while (await reader.readline()).strip():
+            pass  # skip the headers
+        parts = requestLine.decode("latin-1").split()
+        if len(parts) >= 2 and parts[1].split("?")[0] == config["metrics"].get("path", "/metrics"):
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Serving metrics failed: {e}")
+    finally:
+        writer.close()
+
+
+async def startServer():
+    global server
+    listen = config["metrics"].get("listen", "0.0.0.0")
+    port = config["metrics"].get("port", 9090)
+    server = await asyncio.start_server(serve, listen, port)
+    logger.info(f"Metrics are available on http://{listen}:{port}{config['metrics'].get('path', '/metrics')}")
+
+
+async def stopServer():
+    global server
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+        server = None
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import logger
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.persistence", logLevel, config.get("logToConsole", False))
+
+
+class SqlitePersistence(BasePersistence):
+    """Keeps the conversation states and user_data in sqlite, so a restart doesn't end them.
+
+    The Application hands over what changed every `updateInterval` seconds. All of
+    it is written in one transaction in a background thread, so a tap never waits
+    for the disk. Only user_data and the conversations are stored.
+    """
+
+    def __init__(self, path, updateInterval):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=updateInterval,
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS userData (userId INTEGER PRIMARY KEY, data BLOB)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "name TEXT, key TEXT, state BLOB, PRIMARY KEY (name, key))"
+        )
+        self.db.commit()
+        self.lock = threading.Lock()
+        self.pending = {}  # ("userData", userId) or ("conversations", name, key) -> pickled value, None to delete
+        self.writer = None
+
+    def schedule(self, row, value):
+        self.pending[row] = None if value is None else pickle.dumps(value)
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.create_task(self.writePending())
+
+    async def writePending(self):
+        await asyncio.sleep(0)  # let the rest of this round of updates come in first
+        while self.pending:
+            pending, self.pending = self.pending, {}
+            await asyncio.to_thread(self.write, pending)
+
+    def write(self, pending):
+        with self.lock:
+            for row, value in pending.items():
+                table, *key = row
+                if table == "userData" and value is None:
+                    self.db.execute("DELETE FROM userData WHERE userId = ?", key)
+                elif table == "userData":
+                    self.db.execute("INSERT OR REPLACE INTO userData VALUES (?, ?)", (*key, value))
+                elif value is None:
+                    self.db.execute("DELETE FROM conversations WHERE name = ? AND key = ?", key)
+                else:
+                    self.db.execute("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)", (*key, value))
+            self.db.commit()
+        logger.debug(f"Wrote {len(pending)} changed conversations and user_data")
+
+    def read(self, query, parameters=()):
+        with self.lock:
+            return self.db.execute(query, parameters).fetchall()
+
+    async def get_user_data(self):
+        rows = await asyncio.to_thread(self.read, "SELECT userId, data FROM userData")
+        return {userId: pickle.loads(data) for userId, data in rows}
+
+    async def get_conversations(self, name):
+        rows = await asyncio.to_thread(self.read, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_user_data(self, user_id, data):
+        self.schedule(("userData", user_id), data)
+
+    async def drop_user_data(self, user_id):
+        self.schedule(("userData", user_id), None)
+
+    async def update_conversation(self, name, key, new_state):
+        self.schedule(("conversations", name, json.dumps(key)), new_state)
+
+    async def flush(self):
+        if self.writer is not None:
+            await self.writer
+        if self.pending:
+            self.write(self.pending)
+            self.pending = {}
+        with self.lock:
+            self.db.close()
+
+    # Chat data, bot data and callback data aren't used by Addarr
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from telegram.error import BadRequest
+
+import httpclient
+import logger
+from config import config
+from definitions import POSTER_CACHE_PATH
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.posters", logLevel, config.get("logToConsole", False))
+
+PREFETCH_SIZE = 20  # max number of downloaded posters waiting to be sent
+
+
+class PosterCache:
+    """Poster URL -> Telegram file_id of the first upload of that poster.
+
+    Telegram only has to fetch a poster once, later sends reuse the file_id.
+    Bounded (LRU) and kept in sqlite so it survives a restart.
+    """
+
+    def __init__(self, path, maxSize):
+        self.maxSize = maxSize
+        self.fileIds = OrderedDict()
+        self.downloads = OrderedDict()  # url -> poster prefetched before it's sent
+        self.lock = threading.Lock()
+        self.db = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS posters ("
+                "url TEXT PRIMARY KEY, fileId TEXT, stored INTEGER)"
+            )
+            rows = self.db.execute(
+                "SELECT url, fileId FROM posters ORDER BY stored DESC LIMIT ?", (maxSize,)
+            ).fetchall()
+            for url, fileId in reversed(rows):
+                self.fileIds[url] = fileId
+        except sqlite3.Error as e:
+            logger.warning(f"Poster cache isn't persistent, opening {path} failed: {e}")
+            self.db = None
+
+    def get(self, url):
+        fileId = self.fileIds.get(url)
+        if fileId is not None:
+            self.fileIds.move_to_end(url)
+        return fileId
+
+    async def set(self, url, fileId):
+        self.fileIds[url] = fileId
+        self.fileIds.move_to_end(url)
+        while len(self.fileIds) > self.maxSize:
+            self.fileIds.popitem(last=False)
+        if self.db is not None:
+            await asyncio.to_thread(self.write, url, fileId)
+
+    def remove(self, url):
+        self.fileIds.pop(url, None)
+
+    async def prefetch(self, url):
+        if not url or url in self.fileIds or url in self.downloads:
+            return
+        req = await httpclient.getClient("posters").get(url, follow_redirects=True)
+        req.raise_for_status()
+        self.downloads[url] = req.content
+        while len(self.downloads) > PREFETCH_SIZE:
+            self.downloads.popitem(last=False)
+
+    def write(self, url, fileId):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO posters VALUES (?, ?, strftime('%s', 'now'))",
+                (url, fileId),
+            )
+            self.db.execute(
+                "DELETE FROM posters WHERE rowid NOT IN "
+                "(SELECT rowid FROM posters ORDER BY stored DESC LIMIT ?)",
+                (self.maxSize,),
+            )
+            self.db.commit()
+
+
+cache = PosterCache(POSTER_CACHE_PATH, config["posterCacheSize"])
+
+
+# What to send for a poster: the file_id if it has been sent before, else the
+# prefetched poster, else the url for Telegram to fetch
+def media(url):
+    return cache.get(url) or cache.downloads.pop(url, url)
+
+
+async def remember(url, msg):
+    if msg.photo and cache.get(url) is None:
+        await cache.set(url, msg.photo[-1].file_id)
+
+
+# Send a poster, by file_id if it has been sent before. Returns the message or None without poster
+async def sendPoster(bot, chatId, url, **kwargs):
+    if not url:
+        return None
+    fileId = cache.get(url)
+    if fileId is not None:
+        try:
+            return await bot.send_photo(chat_id=chatId, photo=fileId, **kwargs)
+        except BadRequest as e:
+            logger.debug(f"Cached file_id of {url} was refused, sending the url: {e}")
+            cache.remove(url)
+
+    # Upload a prefetched poster ourselves, so Telegram doesn't have to fetch the url
+    msg = await bot.send_photo(chat_id=chatId, photo=cache.downloads.pop(url, url), **kwargs)
+    await remember(url, msg)
+    return msg
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+import logger
+import posters
+import unified
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.prefetch", logLevel, config.get("logToConsole", False))
+
+PREFETCH_AHEAD = 2  # number of upcoming results to warm
+
+# Running prefetches per conversation. Tasks can't live in the (persisted) state,
+# so they're keyed on the user_data dict, which lives as long as the user.
+tasks = {}
+
+
+# Warm the next results of the conversation while the user looks at the current one.
+# `service` is the one the results were searched with.
+def schedule(context, service, conversation):
+    cancel(context)
+    upcoming = conversation.upcoming(PREFETCH_AHEAD)
+    if not upcoming:
+        return
+    key = id(context.user_data)
+    task = asyncio.create_task(warm(service, upcoming))
+    task.add_done_callback(lambda t: tasks.pop(key, None) if tasks.get(key) is t else None)
+    tasks[key] = task
+
+
+async def warm(service, results):
+    for result in results:
+        try:
+            # The lookup record is already part of the result, only the poster
+            # and the library membership still need a request
+            await asyncio.gather(
+                posters.cache.prefetch(result.poster),
+                (unified.serviceOf(result) if result.kind else service).inLibrary(result.id),
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Prefetching {result.title} failed: {e}")
+
+
+def cancel(context):
+    task = tasks.pop(id(context.user_data), None)
+    if task is not None:
+        task.cancel()
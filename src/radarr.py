@@ -1,34 +1,99 @@
 #!/usr/bin/env python3
 
-import json
 import logging
 
-import requests
-
 import commons as commons
+import httpclient
 import logger
 from config import config
+from instances import Instance, MergedLibrary, create, fanOut, mergeLookups, searchLibraries
+from searchcache import cache as searchCache
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr.radarr", logLevel, config.get("logToConsole", False))
 
-config = config["radarr"]
-
 addMovieNeededFields = ["tmdbId", "year", "title", "titleSlug", "images"]
 
 
-def search(title):
-    parameters = {"term": title}
-    url = commons.generateApiQuery("radarr", "movie/lookup", parameters)
-    logger.info(url)
-    req = requests.get(url)
-    parsed_json = json.loads(req.text)
-
-    if req.status_code == 200 and parsed_json:
-        return parsed_json
-    else:
-        return False
+class Radarr(Instance):
+    def __init__(self, app):
+        super().__init__(app, "movie", "tmdbId")
+
+    async def search(self, title):
+        cached = await searchCache.get(self.app, title)
+        if cached is not None:
+            return cached
+
+        parameters = {"term": title}
+        logger.info(commons.generateApiQuery(self.app, "movie/lookup", parameters))
+        req = await httpclient.get(self.app, "movie/lookup", parameters, timeout=httpclient.LOOKUP_TIMEOUT)
+        # An error page isn't JSON, only an answer is decoded
+        if req.status_code != 200:
+            return False
+        parsed_json = req.json()
+
+        if parsed_json:
+            await searchCache.set(self.app, title, parsed_json)
+            return parsed_json
+        else:
+            return False
+
+    async def addToLibrary(self, tmdbId, path, qualityProfileId, tags, lookup=None):
+        if lookup is None:
+            parameters = {"tmdbId": str(tmdbId)}
+            req = await httpclient.get(self.app, "movie/lookup/tmdb", parameters, timeout=httpclient.LOOKUP_TIMEOUT)
+            if req.status_code != 200:
+                return False
+            lookup = req.json()
+        data = self.buildData(lookup, path, qualityProfileId, tags)
+        add = await httpclient.post(self.app, "movie", data)
+        if add.status_code == 201:
+            self.library.add(add.json())
+            return True
+        else:
+            return False
+
+    async def removeFromLibrary(self, tmdbId, dbId=None):
+        parameters = {
+            "deleteFiles": str(True)
+        }
+        if dbId is None:
+            dbId = await self.getDbId(tmdbId)
+        delete = await httpclient.delete(self.app, f"movie/{dbId}", parameters)
+        if delete.status_code == 200:
+            self.library.remove(tmdbId)
+            return True
+        else:
+            return False
+
+    def buildData(self, json, path, qualityProfileId, tags):
+        built_data = {
+            "qualityProfileId": int(qualityProfileId),
+            "minimumAvailability": self.config["minimumAvailability"],
+            "rootFolderPath": path,
+            "addOptions": {"searchForMovie": self.config["search"]},
+            "tags": tags,
+        }
+
+        for key in addMovieNeededFields:
+            built_data[key] = json[key]
+        return built_data
+
+
+instances = create(Radarr, "radarr")
+default = instances[0]
+mergedLibrary = MergedLibrary()
+
+
+def getInstance(app=None):
+    return next((instance for instance in instances if instance.app == app), default)
+
+
+# Looks the title up in all instances at the same time
+async def search(title):
+    answered = await fanOut(instances, lambda instance: instance.search(title))
+    return mergeLookups(answered, "tmdbId") or False
 
 
 def giveTitles(parsed_json):
@@ -44,118 +109,37 @@ def giveTitles(parsed_json):
                     "poster": movie.get("remotePoster", None),
                     "year": movie["year"],
                     "id": movie["tmdbId"],
+                    "lookup": lookupRecord(movie),
                 }
             )
     return data
 
 
-def inLibrary(tmdbId):
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("radarr", "movie", parameters))
-    parsed_json = json.loads(req.text)
-    return next((True for movie in parsed_json if movie["tmdbId"] == tmdbId), False)
-
-
-def addToLibrary(tmdbId, path, qualityProfileId, tags):
-    parameters = {"tmdbId": str(tmdbId)}
-    req = requests.get(
-        commons.generateApiQuery("radarr", "movie/lookup/tmdb", parameters)
-    )
-    parsed_json = json.loads(req.text)
-    data = json.dumps(buildData(parsed_json, path, qualityProfileId, tags))
-    add = requests.post(commons.generateApiQuery("radarr", "movie"), data=data, headers={'Content-Type': 'application/json'})
-    if add.status_code == 201:
-        return True
-    else:
-        return False
-
-
-def removeFromLibrary(tmdbId):
-    parameters = { 
-        "deleteFiles": str(True)
-    }
-    dbId = getDbIdFromImdbId(tmdbId)
-    delete = requests.delete(commons.generateApiQuery("radarr", f"movie/{dbId}", parameters))
-    if delete.status_code == 200:
-        return True
-    else:
-        return False
-
-
-def buildData(json, path, qualityProfileId, tags):
-    built_data = {
-        "qualityProfileId": int(qualityProfileId),
-        "minimumAvailability": config["minimumAvailability"],
-        "rootFolderPath": path,
-        "addOptions": {"searchForMovie": config["search"]},
-        "tags": tags,
-    }
-
-    for key in addMovieNeededFields:
-        built_data[key] = json[key]
-    return built_data
-
-
-def getRootFolders():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("radarr", "Rootfolder", parameters))
-    parsed_json = json.loads(req.text)
-    return parsed_json
-
-
-def all_movies():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("radarr", "movie", parameters))
-    parsed_json = json.loads(req.text)
-
-    if req.status_code == 200:
-        data = []
-        for movie in parsed_json:
-            if all(
-                x in movie
-                for x in ["title", "year", "monitored", "status"]
-            ):
-                data.append(
-                    {
-                        "title": movie["title"],
-                        "year": movie["year"],
-                        "monitored": movie["monitored"],
-                        "status": movie["status"]
-                    }
-                )
-        return data
-    else:
-        return False
-
-
-def getQualityProfiles():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("radarr", "qualityProfile", parameters))
-    parsed_json = json.loads(req.text)
-    return parsed_json
-
-
-def getTags():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("radarr", "tag", parameters))
-    parsed_json = json.loads(req.text)
-    return parsed_json
-
-
-def createTag(tag):
-    data_json = {
-        "id": max([t["id"] for t in getTags()], default=0)+1,
-        "label": str(tag)
-    }
-    add = requests.post(commons.generateApiQuery("radarr", "tag"), json=data_json, headers={'Content-Type': 'application/json'})
-    if add.status_code == 200:
-        return True
-    else:
-        return False
-
-
-def getDbIdFromImdbId(tmdbId):
-    req = requests.get(commons.generateApiQuery("radarr", "movie", {}))
-    parsed_json = json.loads(req.text)
-    dbId = [f["id"] for f in parsed_json if f["tmdbId"] == tmdbId]
-    return dbId[0]
\ No newline at end of file
+# Keep only what buildData needs, so adding doesn't have to look the movie up again
+def lookupRecord(movie):
+    record = {key: movie[key] for key in addMovieNeededFields if key in movie}
+    record["images"] = [
+        {key: image[key] for key in ["coverType", "url", "remoteUrl"] if key in image}
+        for image in movie.get("images", [])
+    ]
+    return record
+
+
+# The movies in the libraries that look like the title, found without asking Radarr
+async def searchLibrary(title):
+    return await searchLibraries(instances, title)
+
+
+# Whether any of the instances has the movie
+async def inLibrary(tmdbId):
+    return bool(await libraryInstances(tmdbId))
+
+
+# The instances that have the movie
+async def libraryInstances(tmdbId):
+    answered = await fanOut(instances, lambda instance: instance.inLibrary(tmdbId))
+    return [instance for instance, has in answered if has]
+
+
+async def all_movies():
+    return await mergedLibrary.sortedItems(instances)
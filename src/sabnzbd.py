@@ -1,12 +1,13 @@
-import requests
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ConversationHandler
 
-from commons import authentication, checkAllowed, checkId, generateApiQuery
+from commons import authentication, checkAllowed, checkId
 from config import config
 from translations import i18n
+import httpclient
 import logging
 import logger
+import metrics
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
@@ -17,6 +18,7 @@ config = config["sabnzbd"]
 SABNZBD_SPEED_LIMIT_25, SABNZBD_SPEED_LIMIT_50, SABNZBD_SPEED_LIMIT_100 = range(3)
 
 
+@metrics.timed
 async def sabnzbd(update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
@@ -58,12 +60,13 @@ async def sabnzbd(update, context):
         ),
     ]]
     markup = InlineKeyboardMarkup(keyboard)
-    update.message.reply_text(
+    await update.message.reply_text(
         i18n.t("addarr.Sabnzbd.Speed"), reply_markup=markup
     )
     return SABNZBD_SPEED_LIMIT_100
 
 
+@metrics.timed
 async def changeSpeedSabnzbd(update, context):
     if not checkId(update):
         if (
@@ -73,10 +76,8 @@ async def changeSpeedSabnzbd(update, context):
 
     choice = update.callback_query.data
 
-    url = generateApiQuery("sabnzbd", "",
-                           {'output': 'json', 'mode': 'config', 'name': 'speedlimit', 'value': choice})
-
-    req = requests.get(url)
+    req = await httpclient.get("sabnzbd", "",
+                               {'output': 'json', 'mode': 'config', 'name': 'speedlimit', 'value': choice})
     message = None
     if req.status_code == 200:
         if choice == SABNZBD_SPEED_LIMIT_100:
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import logger
+from config import config
+from definitions import SEARCH_CACHE_PATH
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.searchcache", logLevel, config.get("logToConsole", False))
+
+STATS_EVERY = 100  # log the hit/miss counters every x lookups
+
+
+def normalize(term):
+    return " ".join(str(term).lower().split())
+
+
+class DiskTier:
+    """sqlite backed second tier, so lookups survive a restart"""
+
+    def __init__(self, path, maxSize):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS search ("
+            "service TEXT, term TEXT, payload TEXT, stored REAL, "
+            "PRIMARY KEY (service, term))"
+        )
+        self.db.commit()
+
+    def get(self, service, term):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT payload, stored FROM search WHERE service = ? AND term = ?",
+                (service, term),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, service, term, payload, stored):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO search VALUES (?, ?, ?, ?)",
+                (service, term, json.dumps(payload), stored),
+            )
+            self.db.execute(
+                "DELETE FROM search WHERE rowid NOT IN "
+                "(SELECT rowid FROM search ORDER BY stored DESC LIMIT ?)",
+                (self.maxSize,),
+            )
+            self.db.commit()
+
+
+class SearchCache:
+    """LRU cache with a TTL for lookup results, keyed on (service, term)"""
+
+    def __init__(self, ttl, maxSize, diskPath=None):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.disk = DiskTier(diskPath, maxSize * 4) if diskPath else None
+
+    def isFresh(self, stored):
+        return time.time() - stored < self.ttl
+
+    async def get(self, service, term):
+        key = (service, normalize(term))
+        entry = self.entries.get(key)
+        if entry is not None and not self.isFresh(entry[1]):
+            self.entries.pop(key)
+            entry = None
+        if entry is None and self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, *key)
+            if entry is not None and self.isFresh(entry[1]):
+                self.store(key, *entry)
+            else:
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        self.logStats(key, entry is not None)
+        return entry[0] if entry is not None else None
+
+    async def set(self, service, term, payload):
+        key = (service, normalize(term))
+        stored = time.time()
+        self.store(key, payload, stored)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, *key, payload, stored)
+
+    def store(self, key, payload, stored):
+        self.entries[key] = (payload, stored)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def logStats(self, key, hit):
+        logger.debug(f"Search cache {'hit' if hit else 'miss'} for {key}")
+        if (self.hits + self.misses) % STATS_EVERY == 0:
+            logger.info(
+                f"Search cache: {self.hits} hits, {self.misses} misses, {len(self.entries)} entries"
+            )
+
+
+cache = SearchCache(
+    config["searchCacheTtl"],
+    config["searchCacheSize"],
+    SEARCH_CACHE_PATH if config["searchCacheOnDisk"] else None,
+)
@@ -0,0 +1,202 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import logger
+import metrics
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.sendqueue", logLevel, config.get("logToConsole", False))
+
+INTERACTIVE, BROADCAST = 0, 1
+PRIORITIES = {INTERACTIVE: "interactive", BROADCAST: "broadcast"}
+BROADCAST_ARGS = {"priority": BROADCAST}  # rate_limit_args of sends nobody is waiting for
+
+# Limits of the Bot API: 30 messages a second overall, about one a second per
+# chat and 20 a minute per group. Rate and burst together stay under the 30.
+GLOBAL_RATE = 25
+GLOBAL_BURST = 5
+CHAT_RATE = 1
+GROUP_RATE = 20 / 60
+CHAT_BURST = 3
+MAX_RETRIES = 2  # RetryAfter errors of a request before giving up
+MAX_CHATS = 1000  # chat buckets kept before the full ones are forgotten
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.pausedUntil = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until a token can be taken
+    def delay(self, now):
+        self.refill(now)
+        missing = max(1 - self.tokens, 0) / self.rate
+        return max(self.pausedUntil - now, missing, 0)
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def isIdle(self, now):
+        self.refill(now)
+        return self.tokens >= self.capacity and self.pausedUntil <= now
+
+
+class SendQueue(BaseRateLimiter):
+    """Rate limiter of the bot: every request to a chat waits for a token of the
+    global bucket and of the bucket of that chat.
+
+    Waiting requests are let through in order of priority, then arrival, so
+    replies to a user go before broadcasts. A request whose chat has no token
+    yet doesn't hold up the requests to other chats. RetryAfter errors pause the
+    chat and the request is tried again.
+    """
+
+    def __init__(self):
+        self.globalBucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chats = {}
+        self.waiting = []  # sorted (priority, order, chat, future)
+        self.order = itertools.count()
+        self.wakeup = None
+        self.dispatcher = None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        for *_, future in self.waiting:
+            future.cancel()
+        self.waiting = []
+
+    def bucket(self, chat):
+        bucket = self.chats.get(chat)
+        if bucket is None:
+            if len(self.chats) >= MAX_CHATS:
+                now = time.monotonic()
+                self.chats = {key: b for key, b in self.chats.items() if not b.isIdle(now)}
+            isGroup = chat.startswith("-") or chat.startswith("@")
+            rate = GROUP_RATE if isGroup else CHAT_RATE
+            bucket = self.chats[chat] = TokenBucket(rate, CHAT_BURST)
+        return bucket
+
+    def depth(self):
+        counts = {name: 0 for name in PRIORITIES.values()}
+        for priority, *_ in self.waiting:
+            counts[PRIORITIES[priority]] += 1
+        return counts
+
+    async def acquire(self, chat, priority):
+        now = time.monotonic()
+        bucket = self.bucket(chat)
+        if not self.waiting and self.globalBucket.delay(now) == 0 and bucket.delay(now) == 0:
+            self.globalBucket.take()
+            bucket.take()
+            metrics.sendQueueWait.observe(0, priority=PRIORITIES[priority])
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self.waiting, (priority, next(self.order), chat, future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.create_task(self.dispatch())
+        else:
+            self.wakeup.set()
+        try:
+            await future
+        finally:
+            metrics.sendQueueWait.observe(time.monotonic() - now, priority=PRIORITIES[priority])
+
+    # Hands out tokens to the waiting requests, stops when none are left
+    async def dispatch(self):
+        while True:
+            self.waiting = [entry for entry in self.waiting if not entry[-1].done()]
+            if not self.waiting:
+                return
+            now = time.monotonic()
+            delay = self.globalBucket.delay(now)
+            if delay == 0:
+                # The first waiting request whose chat has a token goes
+                chatDelays = []
+                for entry in self.waiting:
+                    bucket = self.bucket(entry[2])
+                    chatDelay = bucket.delay(now)
+                    if chatDelay == 0:
+                        self.globalBucket.take()
+                        bucket.take()
+                        self.waiting.remove(entry)
+                        entry[-1].set_result(None)
+                        break
+                    chatDelays.append(chatDelay)
+                else:
+                    delay = min(chatDelays)
+                if delay == 0:
+                    continue
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chatId = data.get("chat_id")
+        chat = None if chatId is None else str(chatId)
+        priority = (rate_limit_args or {}).get("priority", INTERACTIVE)
+        retries = 0
+        while True:
+            # Requests without a chat (answering callbacks, inline queries, ...) aren't limited
+            if chat is not None:
+                await self.acquire(chat, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                metrics.sendRetries.inc(endpoint=endpoint)
+                if retries >= MAX_RETRIES:
+                    raise
+                retries += 1
+                logger.info(f"Telegram asked to wait {seconds}s before the next {endpoint} to chat {chat}")
+                if chat is None:
+                    await asyncio.sleep(seconds)
+                else:
+                    self.bucket(chat).pause(seconds)
+
+
+limiter = SendQueue()
+
+# Notifications that no handler waits for
+pending = set()
+
+
+# Send a broadcast (admin notification, ...) in the background, after the interactive replies
+def notify(bot, chatId, text):
+    task = asyncio.create_task(bot.send_message(chat_id=chatId, text=text, rate_limit_args=BROADCAST_ARGS))
+    pending.add(task)
+    task.add_done_callback(notified)
+
+
+def notified(task):
+    pending.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Sending a notification failed: {task.exception()}")
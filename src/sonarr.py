@@ -1,32 +1,118 @@
 #!/usr/bin/env python3
 
-import json
 import logging
 
-import requests
-
 import commons as commons
+import httpclient
 import logger
 from config import config
+from instances import Instance, MergedLibrary, create, fanOut, mergeLookups, searchLibraries
+from searchcache import cache as searchCache
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr.sonarr", logLevel, config.get("logToConsole", False))
 
-config = config["sonarr"]
-
 addSerieNeededFields = ["tvdbId", "tvRageId", "title", "titleSlug", "images", "seasons"]
 
 
-def search(title):
-    parameters = {"term": title}
-    req = requests.get(commons.generateApiQuery("sonarr", "series/lookup", parameters))
-    parsed_json = json.loads(req.text)
+class Sonarr(Instance):
+    def __init__(self, app):
+        super().__init__(app, "series", "tvdbId")
+
+    async def search(self, title):
+        cached = await searchCache.get(self.app, title)
+        if cached is not None:
+            return cached
+
+        parameters = {"term": title}
+        req = await httpclient.get(self.app, "series/lookup", parameters, timeout=httpclient.LOOKUP_TIMEOUT)
+        # An error page isn't JSON, only an answer is decoded
+        if req.status_code != 200:
+            return False
+        parsed_json = req.json()
+
+        if parsed_json:
+            await searchCache.set(self.app, title, parsed_json)
+            return parsed_json
+        else:
+            return False
+
+    # None when Sonarr doesn't know the series
+    async def lookupSerie(self, tvdbId):
+        parameters = {"term": "tvdb:" + str(tvdbId)}
+        req = await httpclient.get(self.app, "series/lookup", parameters, timeout=httpclient.LOOKUP_TIMEOUT)
+        if req.status_code != 200:
+            return None
+        parsed_json = req.json()
+        return parsed_json[0] if parsed_json else None
+
+    async def addToLibrary(self, tvdbId, path, qualityProfileId, tags, seasonsSelected, lookup=None):
+        if lookup is None:
+            lookup = await self.lookupSerie(tvdbId)
+            if lookup is None:
+                return False
+        data = self.buildData(lookup, path, qualityProfileId, tags, seasonsSelected)
+        add = await httpclient.post(self.app, "series", data)
+        if add.status_code == 201:
+            self.library.add(add.json())
+            return True
+        else:
+            return False
+
+    async def removeFromLibrary(self, tvdbId, dbId=None):
+        parameters = {
+            "deleteFiles": str(True)
+        }
+        if dbId is None:
+            dbId = await self.getDbId(tvdbId)
+        delete = await httpclient.delete(self.app, f"series/{dbId}", parameters)
+        if delete.status_code == 200:
+            self.library.remove(tvdbId)
+            return True
+        else:
+            return False
+
+    def buildData(self, json, path, qualityProfileId, tags, seasonsSelected):
+        built_data = {
+            "qualityProfileId": qualityProfileId,
+            "addOptions": {
+                "ignoreEpisodesWithFiles": True,
+                "ignoreEpisodesWithoutFiles": False,
+                "searchForMissingEpisodes": self.config["search"],
+            },
+            "rootFolderPath": path,
+            "seasonFolder": self.config["seasonFolder"],
+            "monitored": True,
+            "tags": tags,
+            "seasons": seasonsSelected,
+        }
+        for key, value in json.items():
+            if key in addSerieNeededFields:
+                built_data[key] = value
+            if key == "seasons": built_data["seasons"] = seasonsSelected
+        logger.debug(f"Query endpoint is: {commons.generateApiQuery(self.app, 'series')}")
+        return built_data
+
+    async def getSeasons(self, tvdbId, lookup=None):
+        if lookup is None:
+            lookup = await self.lookupSerie(tvdbId)
+        return lookup["seasons"] if lookup is not None else []
+
+
+instances = create(Sonarr, "sonarr")
+default = instances[0]
+mergedLibrary = MergedLibrary()
+
+
+def getInstance(app=None):
+    return next((instance for instance in instances if instance.app == app), default)
+
 
-    if req.status_code == 200 and parsed_json:
-        return parsed_json
-    else:
-        return False
+# Looks the title up in all instances at the same time
+async def search(title):
+    answered = await fanOut(instances, lambda instance: instance.search(title))
+    return mergeLookups(answered, "tvdbId") or False
 
 
 def giveTitles(parsed_json):
@@ -42,139 +128,45 @@ def giveTitles(parsed_json):
                     "seasonCount": show["statistics"]["seasonCount"],
                     "poster": show.get("remotePoster", None),
                     "year": show["year"],
+                    "overview": show.get("overview"),
                     "id": show["tvdbId"],
                     "monitored": show["monitored"],
                     "status": show["status"],
+                    "lookup": lookupRecord(show),
                 }
             )
     return data
 
 
-def inLibrary(tvdbId):
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "series", parameters))
-    parsed_json = json.loads(req.text)
-    return next((True for show in parsed_json if show["tvdbId"] == tvdbId), False)
-
-
-def addToLibrary(tvdbId, path, qualityProfileId, tags, seasonsSelected):
-    parameters = {"term": "tvdb:" + str(tvdbId)}
-    req = requests.get(commons.generateApiQuery("sonarr", "series/lookup", parameters))
-    parsed_json = json.loads(req.text)
-    data = json.dumps(buildData(parsed_json, path, qualityProfileId, tags, seasonsSelected))
-    add = requests.post(commons.generateApiQuery("sonarr", "series"), data=data, headers={'Content-Type': 'application/json'})
-    if add.status_code == 201:
-        return True
-    else:
-        return False
-
-
-def removeFromLibrary(tvdbId):
-    parameters = { 
-        "deleteFiles": str(True)
-    }
-    dbId = getDbIdFromImdbId(tvdbId)
-    delete = requests.delete(commons.generateApiQuery("sonarr", f"series/{dbId}", parameters))
-    if delete.status_code == 200:
-        return True
-    else:
-        return False
-
-
-def buildData(json, path, qualityProfileId, tags, seasonsSelected):
-    built_data = {
-        "qualityProfileId": qualityProfileId,
-        "addOptions": {
-            "ignoreEpisodesWithFiles": True,
-            "ignoreEpisodesWithoutFiles": False,
-            "searchForMissingEpisodes": config["search"],
-        },
-        "rootFolderPath": path,
-        "seasonFolder": config["seasonFolder"],
-        "monitored": True,
-        "tags": tags,
-        "seasons": seasonsSelected,
-    }
-    for show in json:
-        for key, value in show.items():
-            if key in addSerieNeededFields:
-                built_data[key] = value
-            if key == "seasons": built_data["seasons"] = seasonsSelected
-    logger.debug(f"Query endpoint is: {commons.generateApiQuery('sonarr', 'series')}")
-    return built_data
-
-
-def getRootFolders():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "Rootfolder", parameters))
-    parsed_json = json.loads(req.text)
-    # Remove unmappedFolders from rootFolder data--we don't need that
-    for item in [
-        item for item in parsed_json if item.get("unmappedFolders") is not None
-    ]:
-        item.pop("unmappedFolders")
-    return parsed_json
-
-
-def allSeries():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "series", parameters))
-    parsed_json = json.loads(req.text)
-
-    if req.status_code == 200:
-        data = []
-        for show in parsed_json:
-            if all(
-                x in show
-                for x in ["title", "year", "monitored", "status"]
-            ):
-                data.append(
-                    {
-                        "title": show["title"],
-                        "year": show["year"],
-                        "monitored": show["monitored"],
-                        "status": show["status"],
-                    }
-                )
-        return data
-    else:
-        return False
-
-
-def getQualityProfiles():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "qualityProfile", parameters))
-    parsed_json = json.loads(req.text)
-    return parsed_json
-
-
-def getTags():
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "tag", parameters))
-    parsed_json = json.loads(req.text)
-    return parsed_json
-
-
-def createTag(tag):
-    data_json = {
-        "id": int(max([t["id"] for t in getTags()], default=0)+1),
-        "label": str(tag)
-    }
-    add = requests.post(commons.generateApiQuery("sonarr", "tag"), json=data_json, headers={'Content-Type': 'application/json'})
-    if add.status_code == 200:
-        return True
-    else:
-        return False
-
-def getSeasons(tvdbId):
-    parameters = {"term": "tvdb:" + str(tvdbId)}
-    req = requests.get(commons.generateApiQuery("sonarr", "series/lookup", parameters))
-    parsed_json = json.loads(req.text)
-    return parsed_json[0]["seasons"]
-
-
-def getDbIdFromImdbId(tvdbId):
-    req = requests.get(commons.generateApiQuery("sonarr", "series", {}))
-    parsed_json = json.loads(req.text)
-    dbId = [f["id"] for f in parsed_json if f["tvdbId"] == tvdbId]
-    return dbId[0]
+# Keep only what buildData and the season selection need, so adding doesn't have to look the series up again
+def lookupRecord(show):
+    record = {key: show[key] for key in addSerieNeededFields if key in show}
+    record["images"] = [
+        {key: image[key] for key in ["coverType", "url", "remoteUrl"] if key in image}
+        for image in show.get("images", [])
+    ]
+    record["seasons"] = [
+        {"seasonNumber": season["seasonNumber"], "monitored": season.get("monitored", False)}
+        for season in show.get("seasons", [])
+    ]
+    return record
+
+
+# The series in the libraries that look like the title, found without asking Sonarr
+async def searchLibrary(title):
+    return await searchLibraries(instances, title)
+
+
+# Whether any of the instances has the series
+async def inLibrary(tvdbId):
+    return bool(await libraryInstances(tvdbId))
+
+
+# The instances that have the series
+async def libraryInstances(tvdbId):
+    answered = await fanOut(instances, lambda instance: instance.inLibrary(tvdbId))
+    return [instance for instance, has in answered if has]
+
+
+async def allSeries():
+    return await mergedLibrary.sortedItems(instances)
@@ -0,0 +1,140 @@
+import sys
+
+RESULT_WINDOW = 5  # search results kept per conversation, from the current one on
+
+
+class Result:
+    """One search result, only what is shown and what adding it needs"""
+
+    __slots__ = ("id", "title", "year", "poster", "lookup", "kind")
+
+    def __init__(self, item):
+        self.id = item["id"]
+        self.title = item["title"]
+        self.year = item["year"]
+        self.poster = item.get("poster")
+        self.lookup = item.get("lookup")
+        self.kind = item.get("kind")  # "tmdb" or "tvdb" in a search of movies and series together
+
+    def __setstate__(self, slots):
+        restore(self, slots)
+
+
+class BatchItem:
+    """One line of a /batch list and the result it resolved to"""
+
+    __slots__ = ("line", "result", "inLibrary", "selected", "outcome")
+
+    def __init__(self, line, result=None, inLibrary=False):
+        self.line = line
+        self.result = result
+        self.inLibrary = inLibrary
+        self.selected = result is not None and not inLibrary
+        self.outcome = None
+
+    def __setstate__(self, slots):
+        restore(self, slots)
+
+
+class Conversation:
+    """State of an add, delete or batch conversation, kept in user_data["state"].
+
+    All result ids are kept, but only a window of RESULT_WINDOW results starting
+    at the current position. Going past the window takes the next ones from the
+    search again, which the search cache answers.
+    """
+
+    __slots__ = (
+        "choice", "title", "ids", "window", "windowStart", "position",
+        "messageId", "messageIsPhoto", "instance", "unified",
+        "paths", "path", "qualityProfiles", "qualityProfile", "seasons", "selectedSeasons",
+        "batch",
+    )
+
+    def __init__(self):
+        for slot in self.__slots__:
+            setattr(self, slot, None)
+        self.ids = []
+        self.window = []
+        self.windowStart = 0
+        self.position = 0
+        self.messageIsPhoto = False
+
+    def __setstate__(self, slots):
+        restore(self, slots)
+
+    def setResults(self, results, position=0):
+        self.ids = [resultKey(item) for item in results]
+        self.position = position
+        self.fill(results)
+
+    # Keep the results from the current position on, as long as they're still the same
+    def fill(self, results):
+        byId = {resultKey(item): item for item in results}
+        self.windowStart = self.position
+        self.window = []
+        for externalId in self.ids[self.position:self.position + RESULT_WINDOW]:
+            if externalId not in byId:
+                break
+            self.window.append(Result(byId[externalId]))
+
+    def cached(self, position):
+        index = position - self.windowStart
+        if 0 <= index < len(self.window):
+            return self.window[index]
+        return None
+
+    # The current result, None if the search doesn't return it anymore
+    async def result(self, service):
+        result = self.cached(self.position)
+        if result is None and self.position < len(self.ids):
+            found = await service.search(self.title)
+            self.fill(service.giveTitles(found) if found else [])
+            result = self.cached(self.position)
+        return result
+
+    def upcoming(self, count):
+        start = self.position + 1 - self.windowStart
+        return self.window[max(start, 0):max(start + count, 0)]
+
+    def hasNext(self):
+        return self.position < len(self.ids) - 1
+
+
+# Movies and series searched together can have the same id
+def resultKey(item):
+    return (item["kind"], item["id"]) if item.get("kind") else item["id"]
+
+
+# Slots added since a state was persisted start out as None
+def restore(obj, slots):
+    _, values = slots
+    for slot in obj.__slots__:
+        setattr(obj, slot, values.get(slot))
+
+
+def get(context):
+    state = context.user_data.get("state")
+    if state is None:
+        state = context.user_data["state"] = Conversation()
+    return state
+
+
+def clear(context):
+    context.user_data.pop("state", None)
+
+
+# Memory held by an object and everything it references, for the metrics and benchmarks
+def sizeOf(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeOf(key, seen) + sizeOf(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(sizeOf(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(sizeOf(getattr(obj, slot, None), seen) for slot in obj.__slots__)
+    return size
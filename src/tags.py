@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+import httpclient
+import logger
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.tags", logLevel, config.get("logToConsole", False))
+
+
+class TagCache:
+    """label -> id mapping of the tags of one backend, shared by all conversations"""
+
+    def __init__(self, app):
+        self.app = app
+        self.labels = None
+        self.defaultIds = []
+        self.lock = asyncio.Lock()
+
+    async def refresh(self):
+        req = await httpclient.get(self.app, "tag", {})
+        req.raise_for_status()
+        self.labels = {str(t["label"]): int(t["id"]) for t in req.json()}
+        defaultTags = config[self.app].get("defaultTags") or []
+        self.defaultIds = [self.labels[str(label)] for label in defaultTags if str(label) in self.labels]
+        logger.debug(f"Loaded {len(self.labels)} tags of {self.app}, default tags: {self.defaultIds}")
+
+    async def ensure(self):
+        if self.labels is None:
+            await self.refresh()
+
+    async def getId(self, label, create=False):
+        label = str(label)
+        await self.ensure()
+        if label in self.labels or not create:
+            return self.labels.get(label)
+
+        # Only one creation at a time, so two requesters can't create the same tag
+        async with self.lock:
+            if label not in self.labels:
+                add = await httpclient.post(self.app, "tag", {"label": label})
+                if add.status_code not in [200, 201]:
+                    logger.warning(f"Creating tag {label} in {self.app} failed: {add.status_code}")
+                    return None
+                await self.refresh()
+        return self.labels.get(label)
+
+    async def getDefaultIds(self):
+        await self.ensure()
+        return self.defaultIds
@@ -0,0 +1,123 @@
+import re
+import unicodedata
+from collections import Counter
+
+MIN_SCORE = 0.4  # matches scoring lower aren't returned
+MIN_WORD_SCORE = 0.5  # words of a title this unlike a word of the query don't count for it
+YEAR_BONUS = 0.1  # added when the query names the year of the item
+YEAR = re.compile(r"^(19|20)\d\d$")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^0-9a-z]+", " ", text.lower()).strip()
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Half the Dice coefficient, half the part of the trigrams of the query found
+def similarity(shared, querySize, size):
+    return (2 * shared / (querySize + size) + shared / querySize) / 2
+
+
+class TitleIndex:
+    """Word index over the titles and alternate titles of a library.
+
+    The words of all titles form a vocabulary with a trigram index, so a word
+    of the query also finds the words that are spelled a bit differently. A
+    title scores by how many words of the query it has (and how alike they
+    are) and by how few other words it has.
+    """
+
+    def __init__(self, records):
+        # records: external id -> record with "title", "year" and "alternateTitles"
+        self.words = {}  # word -> word number
+        self.wordSizes = []  # word number -> trigrams of the word
+        self.wordNames = []  # word number -> numbers of the names with the word
+        self.grams = {}  # trigram -> word numbers
+        self.owners = []  # name number -> external id
+        self.nameSizes = []  # name number -> words of the name
+        self.years = {}
+        for externalId, record in records.items():
+            self.years[externalId] = record.get("year")
+            names = {normalize(record["title"])}
+            names.update(normalize(title) for title in record.get("alternateTitles") or [])
+            for name in names:
+                words = set(name.split())
+                if not words:
+                    continue
+                number = len(self.owners)
+                self.owners.append(externalId)
+                self.nameSizes.append(len(words))
+                for word in words:
+                    self.wordNames[self.addWord(word)].append(number)
+
+    def addWord(self, word):
+        number = self.words.get(word)
+        if number is None:
+            number = self.words[word] = len(self.wordSizes)
+            grams = trigrams(word)
+            self.wordSizes.append(len(grams))
+            self.wordNames.append([])
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(number)
+        return number
+
+    # Words of the vocabulary that look like `word`, with how much
+    def similarWords(self, word):
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        similar = {}
+        for number, count in shared.items():
+            score = similarity(count, len(grams), self.wordSizes[number])
+            if score >= MIN_WORD_SCORE:
+                similar[number] = score
+        return similar
+
+    # External ids matching the query with their score, best match first
+    def search(self, query, limit):
+        words = normalize(query).split()
+        year = None
+        if len(words) > 1 and YEAR.match(words[-1]):
+            year = int(words.pop())
+        words = list(dict.fromkeys(words))
+        if not words:
+            return []
+
+        found = {}  # name number -> summed similarity of the words of the query it has
+        for word in words:
+            # The most alike word first, a name counts with its best word only
+            best = {}
+            similar = sorted(self.similarWords(word).items(), key=lambda item: -item[1])
+            for number, score in similar:
+                names = self.wordNames[number]
+                if not best:
+                    best = dict.fromkeys(names, score)
+                else:
+                    for name in names:
+                        best.setdefault(name, score)
+            if not found:
+                found = best
+            else:
+                for name, score in best.items():
+                    found[name] = found.get(name, 0) + score
+
+        scores = {}
+        for name, total in found.items():
+            coverage = total / len(words)
+            precision = total / max(len(words), self.nameSizes[name])
+            score = (coverage + precision) / 2
+            externalId = self.owners[name]
+            if year is not None and self.years.get(externalId) == year:
+                score += YEAR_BONUS
+            if score > scores.get(externalId, 0):
+                scores[externalId] = score
+        matches = [(score, externalId) for externalId, score in scores.items() if score >= MIN_SCORE]
+        matches.sort(key=lambda match: -match[0])
+        return matches[:limit]
@@ -1,4 +1,4 @@
-import os
+import asyncio
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ConversationHandler
@@ -6,8 +6,11 @@ from telegram.ext import ConversationHandler
 from commons import authentication, checkAllowed, checkId
 from config import config
 from translations import i18n
+import breaker
+import httpclient
 import logging
 import logger
+import metrics
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
@@ -18,6 +21,7 @@ config = config["transmission"]
 TSL_LIMIT, TSL_NORMAL = range(2)
 
 
+@metrics.timed
 async def transmission(update, context):
     if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
         #When using this mode, bot will remain silent if user is not in the allowlist.txt
@@ -61,6 +65,7 @@ async def transmission(update, context):
     return TSL_NORMAL
 
 
+@metrics.timed
 async def changeSpeedTransmission(update, context):
     if not checkId(update):
         if (
@@ -86,10 +91,32 @@ async def changeSpeedTransmission(update, context):
         command += ' --alt-speed'
         message=i18n.t("addarr.Transmission.ChangedToTSL"),
     
-    os.system(command)
+    await runCommand(command)
 
     await context.bot.send_message(
             chat_id=update.effective_message.chat_id,
             text=message,
         )
     return ConversationHandler.END
+
+
+# transmission-remote behind the circuit breaker of transmission, without blocking the bot
+async def runCommand(command):
+    circuit = breaker.get("transmission")
+    circuit.check()
+    process = await asyncio.create_subprocess_shell(command)
+    try:
+        code = await asyncio.wait_for(process.wait(), httpclient.getTimeout("transmission"))
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()  # reap it, a killed process isn't gone until it's waited for
+        code = None
+    except BaseException:
+        process.kill()
+        circuit.release()
+        raise
+    if code != 0:
+        logger.warning(f"transmission-remote failed with exit code {code}")
+        circuit.failure()
+        raise breaker.BackendUnavailable("transmission")
+    circuit.success()
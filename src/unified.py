@@ -0,0 +1,52 @@
+import asyncio
+import difflib
+import logging
+
+import logger
+import radarr
+import sonarr
+from config import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.unified", logLevel, config.get("logToConsole", False))
+
+# Kinds of results, the prefixes Radarr/Sonarr look ids up with, like in inline mode
+MOVIE, SERIES = "tmdb", "tvdb"
+services = {MOVIE: radarr, SERIES: sonarr}
+marks = {MOVIE: "\U0001F3AC", SERIES: "\U0001F4FA"}  # shown before the title of a result
+
+
+def serviceOf(result):
+    return services[result.kind]
+
+
+# Looks the title up in Radarr and Sonarr at the same time. A backend that fails
+# is left out, unless both fail.
+async def search(title):
+    found = await asyncio.gather(radarr.search(title), sonarr.search(title), return_exceptions=True)
+    if all(isinstance(f, BaseException) for f in found):
+        raise found[0]
+    for kind, f in zip(services, found):
+        if isinstance(f, BaseException):
+            logger.warning(f"Looking up '{title}' in {services[kind].__name__} failed: {f}")
+
+    ranked = []
+    for (kind, service), f in zip(services.items(), found):
+        if isinstance(f, BaseException) or not f:
+            continue
+        for rank, item in enumerate(service.giveTitles(f)):
+            ranked.append((similarity(title, item["title"]), rank, dict(item, kind=kind)))
+    # Titles that look like what was asked for go first, within the same tenth of
+    # similarity the order of Radarr/Sonarr (their own relevance) is kept
+    ranked.sort(key=lambda entry: (-entry[0], entry[1]))
+    return [item for *_, item in ranked]
+
+
+def similarity(title, candidate):
+    return round(difflib.SequenceMatcher(None, title.lower(), str(candidate).lower()).ratio(), 1)
+
+
+# The results are already given titles by search
+def giveTitles(found):
+    return found
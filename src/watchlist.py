@@ -0,0 +1,350 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import tempfile
+import time
+
+from telegram.error import BadRequest
+
+import breaker
+import instances
+import logger
+import metrics
+import radarr
+import sendqueue
+import sonarr
+from commons import checkAllowed, checkId
+from config import config
+from translations import i18n
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.watchlist", logLevel, config.get("logToConsole", False))
+
+MAX_FILE_SIZE = 20 * 1024 * 1024  # bots can't download bigger files
+PROGRESS_INTERVAL = 5  # seconds between edits of the progress message
+CHUNK_SIZE = 64 * 1024
+SERIES_TYPES = {"tvseries", "tvminiseries", "show", "series", "tv"}
+EPISODE_TYPES = {"tvepisode", "episode"}  # rows of single episodes don't name their series, they're skipped
+
+# Running imports per chat, cancelled on shutdown
+running = {}
+
+
+class RateLimit:
+    """Spaces the requests of an import `interval` seconds apart"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next = 0
+
+    async def wait(self):
+        now = time.monotonic()
+        delay = self.next - now
+        self.next = max(now, self.next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@metrics.timed
+async def importFile(update, context):
+    if config.get("enableAllowlist") and not checkAllowed(update,"regular"):
+        #When using this mode, bot will remain silent if user is not in the allowlist.txt
+        logger.info("Allowlist is enabled, but userID isn't added into 'allowlist.txt'. So bot stays silent")
+        return
+
+    chatId = update.effective_message.chat_id
+    if not checkId(update):
+        await context.bot.send_message(chat_id=chatId, text=i18n.t("addarr.Authorize"))
+        return
+
+    if not checkAllowed(update, "admin") and config.get("enableAdmin"):
+        await context.bot.send_message(chat_id=chatId, text=i18n.t("addarr.NotAdmin"))
+        return
+
+    document = update.message.document
+    if chatId in running:
+        await context.bot.send_message(chat_id=chatId, text=i18n.t("addarr.Import.Running"))
+        return
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        await context.bot.send_message(chat_id=chatId, text=i18n.t("addarr.Import.TooBig"))
+        return
+
+    # The import can take a while, so it runs next to the other updates
+    task = asyncio.create_task(runImport(update, context, document))
+    task.add_done_callback(lambda t: running.pop(chatId, None))
+    running[chatId] = task
+
+
+async def runImport(update, context, document):
+    chatId = update.effective_message.chat_id
+    msg = await context.bot.send_message(
+        chat_id=chatId, text=i18n.t("addarr.Import.Started", name=document.file_name)
+    )
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(document.file_name or "")[1])
+    os.close(fd)
+    try:
+        file = await document.get_file()
+        await file.download_to_drive(path)
+        progress = await importWatchlist(context, chatId, msg.message_id, path, update)
+    except asyncio.CancelledError:
+        raise
+    except breaker.BackendUnavailable as e:
+        await context.bot.send_message(
+            chat_id=chatId, text=i18n.t("addarr.Unavailable", service=instances.nameOf(e.app))
+        )
+        return
+    except Exception as e:
+        logger.warning(f"Importing {document.file_name} failed: {e}")
+        await context.bot.send_message(chat_id=chatId, text=i18n.t("addarr.Import.Failed"))
+        return
+    finally:
+        os.remove(path)
+    if progress is None:
+        return
+
+    if not checkAllowed(update,"admin") and config.get("adminNotifyId") is not None:
+        sendqueue.notify(
+            context.bot,
+            config.get("adminNotifyId"),
+            i18n.t(
+                "addarr.Notifications.Import",
+                count=progress["added"],
+                first_name=update.effective_message.chat.first_name,
+                chat_id=chatId,
+            ),
+        )
+
+
+async def importWatchlist(context, chatId, messageId, path, update):
+    progress = {"read": 0, "added": 0, "skipped": 0, "notFound": 0, "failed": 0}
+    services = {"movie": radarr, "series": sonarr}
+    known = {}
+    settings = {}
+    limit = RateLimit(config["importInterval"])
+    lastEdit = time.monotonic()
+
+    # The same settings are used for every line, so they're resolved once for the
+    # kinds in the file and a missing one stops the import before anything is added
+    for kind in {item["kind"] for item in readWatchlist(path)}:
+        service = services[kind]
+        settings[service] = await addSettings(service.default, update)
+        if settings[service] is None:
+            await showProgress(context, chatId, messageId, "addarr.Import.NoSettings", {"service": service.default.name})
+            return None
+
+    for item in readWatchlist(path):
+        progress["read"] += 1
+        service = services[item["kind"]]
+        if service not in known:
+            known[service] = await libraryKeys(service)
+        try:
+            outcome = await importItem(service, item, known[service], settings, limit, update)
+        except breaker.BackendUnavailable:
+            await showProgress(context, chatId, messageId, "addarr.Import.Progress", progress)
+            raise
+        except Exception as e:
+            logger.warning(f"Importing {item['title']} failed: {e}")
+            outcome = "failed"
+        progress[outcome] += 1
+
+        if time.monotonic() - lastEdit >= PROGRESS_INTERVAL:
+            await showProgress(context, chatId, messageId, "addarr.Import.Progress", progress)
+            lastEdit = time.monotonic()
+
+    await showProgress(context, chatId, messageId, "addarr.Import.Done", progress)
+    return progress
+
+
+async def showProgress(context, chatId, messageId, key, progress):
+    try:
+        await context.bot.edit_message_text(
+            chat_id=chatId,
+            message_id=messageId,
+            text=i18n.t(key, **progress),
+            rate_limit_args=sendqueue.BROADCAST_ARGS,
+        )
+    except BadRequest as e:
+        logger.debug(f"Updating the import progress failed: {e}")
+
+
+async def importItem(service, item, known, settings, limit, update):
+    if isKnown(item, known):
+        return "skipped"
+
+    if item["id"] is not None:
+        term = f"{'tmdb' if service == radarr else 'tvdb'}:{item['id']}"
+    elif item["imdb"]:
+        term = f"imdb:{item['imdb']}"
+    elif item["title"]:
+        term = item["title"]
+    else:
+        return "notFound"
+
+    await limit.wait()
+    found = await service.search(term)
+    results = service.giveTitles(found) if found else []
+    if item["year"] is not None:
+        results = [r for r in results if r["year"] == item["year"]] or results
+    if not results:
+        return "notFound"
+    result = results[0]
+    if result["id"] in known["ids"]:
+        return "skipped"
+
+    path, qualityProfile, tags = settings[service]
+    await limit.wait()
+    if service == radarr:
+        added = await service.default.addToLibrary(result["id"], path, qualityProfile, tags, lookup=result["lookup"])
+    else:
+        seasons = await service.default.getSeasons(result["id"], result["lookup"])
+        seasonsSelected = [{"seasonNumber": s["seasonNumber"], "monitored": True} for s in seasons]
+        added = await service.default.addToLibrary(result["id"], path, qualityProfile, tags, seasonsSelected, lookup=result["lookup"])
+    if not added:
+        return "failed"
+    # Later lines of the same watchlist can point to it as well
+    known["ids"].add(result["id"])
+    return "added"
+
+
+# Everything in the library indexes of all instances that a watchlist line can
+# match without a lookup. New items go to the first instance.
+async def libraryKeys(service):
+    records = {}
+    for instance in service.instances:
+        await instance.library.ensure()
+        records.update(instance.library.items)
+    return {
+        "ids": set(records),
+        "imdb": {record["imdbId"] for record in records.values() if record["imdbId"]},
+        "titles": {(str(record["title"]).lower(), record["year"]) for record in records.values()},
+    }
+
+
+def isKnown(item, known):
+    if item["id"] is not None and item["id"] in known["ids"]:
+        return True
+    if item["imdb"] and item["imdb"] in known["imdb"]:
+        return True
+    return item["year"] is not None and (item["title"].lower(), item["year"]) in known["titles"]
+
+
+# An import has no conversation to ask in, so it takes the first root folder and
+# quality profile of the instance that aren't excluded and the tags of a normal add.
+# None when every root folder or quality profile is excluded.
+async def addSettings(service, update):
+    excludedPaths = service.config.get("excludedRootFolders", [])
+    paths = [p["path"] for p in await service.getRootFolders() if p["path"] not in excludedPaths]
+    excludedProfiles = service.config.get("excludedQualityProfiles", [])
+    qualityProfiles = [q["id"] for q in await service.getQualityProfiles() if q["name"] not in excludedProfiles]
+    if not paths or not qualityProfiles:
+        logger.warning(f"{service.name} has no root folder or quality profile an import can add to")
+        return None
+
+    tags = []
+    if service.config.get("addRequesterIdTag"):
+        tagId = await service.getTagId(update.effective_message.chat.id, create=True)
+        if tagId is not None:
+            tags.append(tagId)
+    if not tags:
+        tags = await service.getDefaultTagIds()
+    return paths[0], qualityProfiles[0], tags
+
+
+# Items of a watchlist, read from the file as they're needed
+def readWatchlist(path):
+    if path.lower().endswith(".json"):
+        for entry in readJson(path):
+            item = fromTrakt(entry) if isinstance(entry, dict) else None
+            if item is not None:
+                yield item
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            for row in csv.DictReader(file):
+                item = fromCsv(row)
+                if item is not None:
+                    yield item
+
+
+# Objects of a JSON array (or JSON lines) one at a time, without reading the whole file
+def readJson(path):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    with open(path, encoding="utf-8-sig") as file:
+        while True:
+            buffer = buffer.lstrip(" \t\r\n[,")
+            if buffer.startswith("]"):
+                return
+            if buffer:
+                try:
+                    entry, end = decoder.raw_decode(buffer)
+                    buffer = buffer[end:]
+                    yield entry
+                    continue
+                except json.JSONDecodeError:
+                    pass  # the object continues in the next chunk
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                if buffer:
+                    decoder.raw_decode(buffer)  # raises the error of the broken object
+                return
+            buffer += chunk
+
+
+# Trakt: {"type": "movie", "movie": {"title", "year", "ids": {...}}}, shows as "show"
+def fromTrakt(entry):
+    kind = entry.get("type")
+    media = entry.get("movie") if kind == "movie" else entry.get("show")
+    if not isinstance(media, dict):
+        return None
+    ids = media.get("ids") or {}
+    return makeItem(
+        "movie" if kind == "movie" else "series",
+        media.get("title"),
+        media.get("year"),
+        ids.get("imdb"),
+        ids.get("tmdb") if kind == "movie" else ids.get("tvdb"),
+    )
+
+
+# IMDb (Const, Title, Title Type, Year), Letterboxd (Name, Year) or plain title/year/type/tmdb/tvdb/imdb columns
+def fromCsv(row):
+    row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if isinstance(key, str)}
+    # IMDb writes "TV Series" in newer exports and "tvSeries" in older ones
+    titleType = (row.get("title type") or row.get("type") or "").lower().replace(" ", "")
+    if titleType in EPISODE_TYPES:
+        return None
+    kind = "series" if titleType in SERIES_TYPES else "movie"
+    return makeItem(
+        kind,
+        row.get("title") or row.get("name"),
+        row.get("year"),
+        row.get("const") or row.get("imdb"),
+        row.get("tmdb") if kind == "movie" else row.get("tvdb"),
+    )
+
+
+def makeItem(kind, title, year, imdb, externalId):
+    if not title and not imdb and not externalId:
+        return None
+    return {
+        "kind": kind,
+        "title": str(title or ""),
+        "year": toInt(year),
+        "imdb": imdb or None,
+        "id": toInt(externalId),
+    }
+
+
+def toInt(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def cancelAll():
+    for task in running.values():
+        task.cancel()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import httpx
+
+BOT = {"id": 1, "is_bot": True, "first_name": "Addarr", "username": "addarr_test_bot"}
+
+
+class FakeBotApi:
+    """Minimal local stand-in for the Telegram Bot API, prints every call of the bot"""
+
+    def __init__(self, port, chatId):
+        self.chatId = chatId
+        self.messageIds = itertools.count(1000)
+        self.lastMessageId = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def message(self, parameters):
+        self.lastMessageId = int(parameters.get("message_id") or next(self.messageIds))
+        message = {
+            "message_id": self.lastMessageId,
+            "date": int(time.time()),
+            "chat": {"id": int(parameters.get("chat_id") or self.chatId), "type": "private"},
+            "from": BOT,
+        }
+        if "photo" in parameters or "media" in parameters:
+            message["photo"] = [{"file_id": "fake", "file_unique_id": "fake", "width": 1, "height": 1}]
+            message["caption"] = parameters.get("caption", "")
+        else:
+            message["text"] = parameters.get("text", "")
+        return message
+
+    def answer(self, method, parameters):
+        if method == "getMe":
+            return BOT
+        if method.startswith("send") or method.startswith("edit"):
+            return self.message(parameters)
+        return True
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = urlparse(self.path).path.rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length", 0))
+                parameters = parseBody(self.headers.get("Content-Type", ""), self.rfile.read(length))
+                print(f"<- {method} {json.dumps(parameters, ensure_ascii=False)}", flush=True)
+                body = json.dumps({"ok": True, "result": api.answer(method, parameters)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def parseBody(contentType, body):
+    if contentType.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if contentType.startswith("multipart/form-data"):
+        message = BytesParser().parsebytes(b"Content-Type: " + contentType.encode() + b"\r\n\r\n" + body)
+        return {
+            part.get_param("name", header="content-disposition"): part.get_payload(decode=True).decode(errors="replace")
+            for part in message.get_payload()
+        }
+    return dict(parse_qsl(body.decode()))
+
+
+def makeUpdate(updateId, line, chatId, api):
+    user = {"id": chatId, "is_bot": False, "first_name": "Tester", "username": "tester"}
+    chat = {"id": chatId, "type": "private", "first_name": "Tester"}
+    if line.startswith("cb:"):
+        # Press an inline keyboard button of the last message of the bot
+        return {
+            "update_id": updateId,
+            "callback_query": {
+                "id": str(updateId),
+                "from": user,
+                "chat_instance": str(chatId),
+                "data": line[3:],
+                "message": {
+                    "message_id": api.lastMessageId or 1,
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": BOT,
+                    "text": "",
+                },
+            },
+        }
+    if line.startswith("inline:"):
+        return {
+            "update_id": updateId,
+            "inline_query": {"id": str(updateId), "from": user, "query": line[7:], "offset": ""},
+        }
+    message = {
+        "message_id": updateId,
+        "date": int(time.time()),
+        "chat": chat,
+        "from": user,
+        "text": line,
+    }
+    if line.startswith("/"):
+        # CommandHandlers only match messages with a bot_command entity
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(line.split()[0])}]
+    return {"update_id": updateId, "message": message}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Post fake Telegram updates to the webhook of Addarr and print what the bot sends back"
+    )
+    parser.add_argument("--webhook", default="http://127.0.0.1:8443/telegram", help="url of the webhook of the bot")
+    parser.add_argument("--secret", help="the webhook/secretToken of the config")
+    parser.add_argument("--chat-id", type=int, default=12345)
+    parser.add_argument("--api-port", type=int, default=8081, help="port of the fake Bot API")
+    args = parser.parse_args()
+
+    api = FakeBotApi(args.api_port, args.chat_id).start()
+    print(
+        f"Fake Bot API on http://127.0.0.1:{args.api_port}/bot, set it as telegram/apiUrl in the config.\n"
+        "Type a message per line, 'cb:<data>' to press a button or 'inline:<query>' for an inline query.",
+        file=sys.stderr,
+    )
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    try:
+        for updateId, line in enumerate(sys.stdin, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            update = makeUpdate(updateId, line, args.chat_id, api)
+            try:
+                response = httpx.post(args.webhook, json=update, headers=headers)
+                print(f"-> {line} ({response.status_code})", flush=True)
+            except httpx.HTTPError as e:
+                print(f"-> {line} failed: {e}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()